@@ -0,0 +1,59 @@
+# ============================================================
+# bench/envelope.py — Micro-benchmark de l’enveloppe d’événements
+# ------------------------------------------------------------
+# Compare, pour un BookingCreated typique, la taille du corps et le
+# coût encode + decode (validation de schéma comprise) :
+#   json     → json standard (ancien chemin json.dumps / json.loads)
+#   orjson   → application/json encodé par orjson
+#   msgpack  → application/msgpack
+#   peek     → lecture du type dans les propriétés AMQP (sans décoder)
+#
+#   PYTHONPATH=services python bench/envelope.py [-n 100000] [--json]
+# ============================================================
+import argparse, json, sys, time
+from common import envelope
+
+
+PAYLOAD = {"bookingId": 123456, "userId": 42, "studioId": 7,
+           "start": "2026-10-17T10:00:00+00:00", "end": "2026-10-17T12:00:00+00:00"}
+
+
+def bench(n: int, fn) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6   # µs par opération
+
+
+def run(n: int) -> dict:
+    results = {}
+    saved = envelope.orjson
+    variants = [("json", "json", None), ("orjson", "json", saved), ("msgpack", "msgpack", saved)]
+    for name, encoding, codec in variants:
+        if name == "orjson" and codec is None:
+            continue    # orjson non installé
+        envelope.orjson = codec
+        body, props = envelope.encode("BookingCreated", PAYLOAD, encoding=encoding)
+        results[name] = {
+            "bytes": len(body),
+            "encode_us": round(bench(n, lambda: envelope.encode("BookingCreated", PAYLOAD, encoding=encoding)), 3),
+            "decode_us": round(bench(n, lambda: envelope.decode(body, props)), 3),
+        }
+    envelope.orjson = saved
+    _, props = envelope.encode("BookingCreated", PAYLOAD)
+    results["peek"] = {"decode_us": round(bench(n, lambda: envelope.peek_type(props)), 3)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark de l’enveloppe d’événements")
+    parser.add_argument("-n", type=int, default=100000, help="itérations par mesure")
+    parser.add_argument("--json", action="store_true", help="résultats en JSON")
+    args = parser.parse_args()
+    results = run(args.n)
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        for name, r in results.items():
+            print(f"{name:8} {r.get('bytes', '-'):>6} B  encode {r.get('encode_us', '-'):>8} µs  decode {r['decode_us']:>8} µs")
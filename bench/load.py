@@ -0,0 +1,372 @@
+# ============================================================
+# bench/load.py — Test de charge de la saga de réservation
+# ------------------------------------------------------------
+# Charge en boucle ouverte : --rate réservations par seconde pendant
+# --duration secondes, quel que soit le temps de réponse. Pour
+# chaque réservation :
+#   1. POST /v1/bookings (studio propre à la réservation, créneau en
+#      cours : le check-in est possible tout de suite)
+#   2. attente de READY / CANCELLED (long-poll ?wait=)
+#   3. pour une fraction --checkin-ratio des READY : check-in avec
+#      le code puis check-out
+#
+# Mesures :
+#   - latences par opération (p50 / p99 / max), dont "ready" :
+#     création → READY vu par le client
+#   - débit par opération et par service : messages consommés par
+#     seconde (consumer_messages_total), retard et profondeur max des
+#     files (consumer_lag_seconds, consumer_queue_depth), relevés sur
+#     GET /metrics de chaque service pendant le test
+#
+# Résultats en JSON (--out) pour comparer deux commits (--compare).
+#
+# Cibles :
+#   - défaut : services déployés (docker compose, --{service}-url)
+#   - --inprocess : les quatre services dans ce processus
+#     (services/monolith.py : SQLite + broker en mémoire), sans
+#     Docker ni RabbitMQ ; les métriques sont celles du processus
+#
+#   python bench/load.py --rate 20 --duration 60 --out results.json
+#   python bench/load.py ... --compare results-main.json
+#   python bench/load.py --inprocess --rate 20 --out inprocess.json
+# ============================================================
+import argparse, asyncio, json, os, random, re, socket, subprocess, sys, tempfile, threading, time
+from datetime import datetime, timedelta, timezone
+import httpx
+
+SERVICES = ("booking", "access", "quota", "notification")
+DEFAULT_URLS = {"booking": "http://localhost:8000", "access": "http://localhost:8001",
+                "quota": "http://localhost:8002", "notification": "http://localhost:8004"}
+FINAL = ("READY", "CANCELLED")
+
+
+# ------------------------------------------------------------
+# Cible : un client HTTP par service
+# ------------------------------------------------------------
+class HttpTarget:
+    def __init__(self, urls: dict):
+        self.urls = urls
+        self.clients = {}
+        # relevés /metrics : étiquette du résultat → service interrogé
+        self.scraped = {s: s for s in SERVICES}
+
+    async def __aenter__(self):
+        limits = httpx.Limits(max_connections=500, max_keepalive_connections=100)
+        self.clients = {name: httpx.AsyncClient(base_url=url, timeout=60, limits=limits)
+                        for name, url in self.urls.items()}
+        return self
+
+    async def __aexit__(self, *exc):
+        for c in self.clients.values():
+            await c.aclose()
+
+    def client(self, service: str) -> httpx.AsyncClient:
+        return self.clients[service]
+
+
+# Les quatre services dans ce processus (services/monolith.py), servis
+# par uvicorn dans un thread sur un port libre ; bases SQLite dans un
+# dossier temporaire, événements par le broker en mémoire
+class InProcessTarget(HttpTarget):
+    def __init__(self):
+        super().__init__({})
+        # registre de métriques partagé : un seul relevé suffit
+        self.scraped = {"monolith": "booking"}
+        self.server = None
+        self.thread = None
+
+    async def __aenter__(self):
+        import uvicorn
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        os.environ["EVENT_TRANSPORT"] = "memory"
+        os.environ["MONOLITH_URL"] = f"http://127.0.0.1:{port}"
+        os.environ.setdefault("MONOLITH_DATA", tempfile.mkdtemp(prefix="load-"))
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services"))
+        import monolith
+
+        self.server = uvicorn.Server(uvicorn.Config(monolith.app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, name="monolith", daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("in-process services failed to start")
+            await asyncio.sleep(0.05)
+        self.urls = {s: f"http://127.0.0.1:{port}{monolith.MOUNTS[s]}" for s in SERVICES}
+        return await super().__aenter__()
+
+    async def __aexit__(self, *exc):
+        await super().__aexit__(*exc)
+        self.server.should_exit = True
+        await asyncio.to_thread(self.thread.join, 10)
+
+
+# ------------------------------------------------------------
+# Statistiques
+# ------------------------------------------------------------
+def percentile(sorted_values: list, q: float):
+    if not sorted_values:
+        return None
+    i = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))
+    return sorted_values[i]
+
+
+def summarize(samples: list, errors: int, duration: float) -> dict:
+    v = sorted(samples)
+    ms = lambda x: None if x is None else round(x * 1000, 3)
+    return {"count": len(v), "errors": errors, "per_s": round(len(v) / duration, 3) if duration else None,
+            "p50_ms": ms(percentile(v, 0.5)), "p99_ms": ms(percentile(v, 0.99)),
+            "mean_ms": ms(sum(v) / len(v)) if v else None, "max_ms": ms(v[-1] if v else None)}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.outcomes = {}
+
+    def ok(self, op: str, seconds: float):
+        self.samples.setdefault(op, []).append(seconds)
+
+    def error(self, op: str):
+        self.errors[op] = self.errors.get(op, 0) + 1
+
+    def outcome(self, status: str):
+        self.outcomes[status] = self.outcomes.get(status, 0) + 1
+
+
+# ------------------------------------------------------------
+# Relevés /metrics (format texte Prometheus)
+# ------------------------------------------------------------
+def parse_metrics(text: str) -> dict:
+    series = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        key, _, value = line.rpartition(" ")
+        try:
+            series[key] = float(value)
+        except ValueError:
+            continue
+    return series
+
+
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _labels(key: str) -> dict:
+    return dict(LABEL.findall(key[key.find("{"):])) if "{" in key else {}
+
+
+def by_consumer(series: dict, name: str) -> dict:
+    out = {}
+    for key, value in series.items():
+        if key.startswith(name + "{"):
+            out[_labels(key).get("consumer", "")] = value
+    return out
+
+
+def lag_quantile(before: dict, after: dict, consumer: str, q: float):
+    # quantile du retard sur la fenêtre du test (écart des buckets cumulés)
+    buckets = []
+    for key, value in after.items():
+        if key.startswith("consumer_lag_seconds_bucket{"):
+            labels = _labels(key)
+            if labels.get("consumer") == consumer:
+                le = float("inf") if labels["le"] == "+Inf" else float(labels["le"])
+                buckets.append((le, value - before.get(key, 0)))
+    buckets.sort()
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return None
+    for le, n in buckets:
+        if n >= q * total:
+            return le
+    return None
+
+
+async def scrape(target, service: str) -> dict:
+    try:
+        r = await target.client(service).get("/metrics")
+        r.raise_for_status()
+        return parse_metrics(r.text)
+    except Exception:
+        return {}
+
+
+async def sample_backlog(target, depth_max: dict, stop: asyncio.Event, every: float = 1.0):
+    while not stop.is_set():
+        for label, service in target.scraped.items():
+            for consumer, depth in by_consumer(await scrape(target, service), "consumer_queue_depth").items():
+                key = f"{label}/{consumer}"
+                depth_max[key] = max(depth_max.get(key, 0), depth)
+        try:
+            await asyncio.wait_for(stop.wait(), every)
+        except asyncio.TimeoutError:
+            pass
+
+
+# ------------------------------------------------------------
+# Scénario d’une réservation
+# ------------------------------------------------------------
+async def timed(rec: Recorder, op: str, coro):
+    t0 = time.perf_counter()
+    try:
+        r = await coro
+        r.raise_for_status()
+    except Exception:
+        rec.error(op)
+        return None, None
+    rec.ok(op, time.perf_counter() - t0)
+    return r, t0
+
+
+async def one_booking(target, rec: Recorder, i: int, args):
+    booking = target.client("booking")
+    now = datetime.now(timezone.utc)
+    body = {"user_id": args.user_base + (i % args.users if args.users else i),
+            "studio_id": args.studio_base + i,
+            "start": (now - timedelta(minutes=1)).isoformat(),
+            "end": (now + timedelta(minutes=59)).isoformat()}
+    r, t0 = await timed(rec, "create", booking.post("/v1/bookings", json=body))
+    if r is None:
+        return
+    booking_id = r.json()["id"]
+
+    status, view = None, None
+    deadline = t0 + args.ready_timeout
+    while time.perf_counter() < deadline:
+        try:
+            rv = await booking.get(f"/v1/bookings/{booking_id}", params={"wait": min(30, args.ready_timeout)})
+            view = rv.json()
+        except Exception:
+            break
+        status = view.get("status")
+        if status in FINAL:
+            break
+    if status not in FINAL:
+        rec.error("ready")
+        rec.outcome("TIMEOUT")
+        return
+    rec.outcome(status)
+    if status == "CANCELLED":
+        return
+    rec.ok("ready", time.perf_counter() - t0)
+
+    if random.random() >= args.checkin_ratio:
+        return
+    r, _ = await timed(rec, "checkin", booking.post(f"/v1/bookings/{booking_id}/checkin",
+                                                    params={"code": view.get("code")}))
+    if r is not None:
+        await timed(rec, "checkout", booking.post(f"/v1/bookings/{booking_id}/checkout"))
+
+
+# Boucle ouverte : une réservation toutes les 1/rate secondes
+async def drive(target, rec: Recorder, args):
+    tasks, interval = [], 1 / args.rate
+    start = time.perf_counter()
+    i = 0
+    while time.perf_counter() - start < args.duration:
+        tasks.append(asyncio.create_task(one_booking(target, rec, i, args)))
+        i += 1
+        await asyncio.sleep(max(0.0, start + i * interval - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    return i
+
+
+async def run(target, args) -> dict:
+    rec = Recorder()
+    before = {label: await scrape(target, s) for label, s in target.scraped.items()}
+    depth_max, stop = {}, asyncio.Event()
+    sampler = asyncio.create_task(sample_backlog(target, depth_max, stop))
+    t0 = time.perf_counter()
+    started = datetime.now(timezone.utc)
+    issued = await drive(target, rec, args)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await sampler
+    after = {label: await scrape(target, s) for label, s in target.scraped.items()}
+
+    services = {}
+    for s in target.scraped:
+        b, a = by_consumer(before[s], "consumer_messages_total"), by_consumer(after[s], "consumer_messages_total")
+        services[s] = {
+            "messages_per_s": {c: round((a[c] - b.get(c, 0)) / elapsed, 3) for c in a},
+            "lag_p50_s": {c: lag_quantile(before[s], after[s], c, 0.5) for c in a},
+            "lag_p99_s": {c: lag_quantile(before[s], after[s], c, 0.99) for c in a},
+            "queue_depth_max": {k.split("/", 1)[1]: v for k, v in depth_max.items() if k.startswith(s + "/")},
+            "metrics": bool(after[s]),
+        }
+    return {
+        "label": args.label,
+        "target": "inprocess" if args.inprocess else "http",
+        "started_at": started.isoformat(),
+        "elapsed_s": round(elapsed, 3),
+        "config": {k: getattr(args, k) for k in ("rate", "duration", "checkin_ratio", "users", "ready_timeout")},
+        "issued": issued,
+        "outcomes": rec.outcomes,
+        "operations": {op: summarize(rec.samples.get(op, []), rec.errors.get(op, 0), elapsed)
+                       for op in ("create", "ready", "checkin", "checkout")},
+        "services": services,
+    }
+
+
+# ------------------------------------------------------------
+# Comparaison avec un résultat précédent
+# ------------------------------------------------------------
+def compare(old: dict, new: dict) -> list:
+    lines = [f"{'operation':10} {'metric':8} {old.get('label') or 'old':>12} {new.get('label') or 'new':>12} {'delta':>8}"]
+    for op, stats in new["operations"].items():
+        for m in ("p50_ms", "p99_ms", "per_s"):
+            a, b = old.get("operations", {}).get(op, {}).get(m), stats.get(m)
+            delta = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else "-"
+            lines.append(f"{op:10} {m:8} {str(a):>12} {str(b):>12} {delta:>8}")
+    return lines
+
+
+def git_label() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def make_target(args):
+    if args.inprocess:
+        return InProcessTarget()
+    return HttpTarget({s: getattr(args, f"{s}_url") for s in SERVICES})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test de charge de la saga de réservation")
+    parser.add_argument("--rate", type=float, default=10, help="réservations créées par seconde")
+    parser.add_argument("--duration", type=float, default=30, help="durée d’injection (s)")
+    parser.add_argument("--checkin-ratio", type=float, default=0.5, help="part des READY suivies d’un check-in/out")
+    parser.add_argument("--users", type=int, default=0, help="nombre d’utilisateurs distincts (0 : un par réservation)")
+    parser.add_argument("--user-base", type=int, default=random.randint(1, 10**6) * 1000)
+    parser.add_argument("--studio-base", type=int, default=random.randint(1, 10**6) * 1000)
+    parser.add_argument("--ready-timeout", type=float, default=60, help="attente max de READY (s)")
+    parser.add_argument("--label", default=git_label(), help="étiquette du résultat (défaut : commit courant)")
+    parser.add_argument("--out", help="fichier JSON des résultats")
+    parser.add_argument("--compare", help="résultat JSON précédent à comparer")
+    parser.add_argument("--inprocess", action="store_true",
+                        help="services dans ce processus (SQLite + broker en mémoire) au lieu des URL")
+    for s in SERVICES:
+        parser.add_argument(f"--{s}-url", default=DEFAULT_URLS[s])
+    args = parser.parse_args()
+
+    async def main():
+        async with make_target(args) as target:
+            return await run(target, args)
+
+    result = asyncio.run(main())
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), result)))
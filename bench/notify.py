@@ -0,0 +1,81 @@
+# ============================================================
+# bench/notify.py — Débit et latence du dispatcher de notifications
+# ------------------------------------------------------------
+# Lance dans ce processus le serveur SMTP de test
+# (services/notification/smtp_sink.py, --delay-ms de latence par
+# message) et un Dispatcher avec le sender SMTP, puis remet -n
+# réservations comme le ferait le consumer :
+#   - BookingCreated puis BookingReady (une fraction --cancel-ratio
+#     est annulée à la place)
+#   - --recipients utilisateurs distincts (limite par destinataire)
+# Mesures : messages reçus par le serveur, débit, regroupements,
+# retards dus à la limite, latence réception → envoi (p50 / p99) et
+# durée d’un envoi, lues sur les métriques du processus.
+#
+#   PYTHONPATH=services:services/notification python bench/notify.py -n 500 --delay-ms 100 --concurrency 16
+# ============================================================
+import argparse, asyncio, json, random, sys, time
+from common import metrics
+from dispatcher import Dispatcher
+from senders import SmtpSender
+from smtp_sink import SmtpSink
+
+
+def feed(dispatcher, args):
+    # thread du "consumer" : submit() attend sans limite (timeout=None) si
+    # NOTIFY_QUEUE_MAX est atteint, au lieu de lever Requeue
+    for i in range(1, args.n + 1):
+        user = random.randint(1, args.recipients)
+        dispatcher.submit("BookingCreated", {"bookingId": i, "userId": user}, timeout=None)
+        if random.random() < args.cancel_ratio:
+            dispatcher.submit("BookingCancelled", {"bookingId": i, "userId": user, "reason": "QuotaDenied"}, timeout=None)
+        else:
+            dispatcher.submit("BookingReady", {"bookingId": i, "userId": user}, timeout=None)
+
+
+async def main(args):
+    sink = await SmtpSink(port=0, delay_ms=args.delay_ms).start()
+    dispatcher = Dispatcher(SmtpSender("127.0.0.1", sink.port), concurrency=args.concurrency,
+                            coalesce_ms=args.coalesce_ms, rate_per_min=args.rate_per_min,
+                            burst=args.burst).start()
+    t0 = time.perf_counter()
+    await asyncio.to_thread(feed, dispatcher, args)
+    await asyncio.to_thread(dispatcher.stop, args.timeout)
+    elapsed = time.perf_counter() - t0
+    await sink.stop()
+
+    snap = metrics.snapshot()
+    delivery, send = snap["notify_delivery_seconds"], snap["notify_send_seconds"]
+    return {
+        "events": snap["notify_events_total"]["value"],
+        "mails": sink.received,
+        "coalesced": snap["notify_coalesced_total"]["value"],
+        "rate_limited": snap["notify_rate_limited_total"]["value"],
+        "failed": snap['notify_messages_total{outcome="failed"}']["value"],
+        "elapsed_s": round(elapsed, 3),
+        "mails_per_s": round(sink.received / elapsed, 1) if elapsed else None,
+        "delivery_p50_s": delivery["p50"], "delivery_p99_s": delivery["p99"],
+        "send_p50_s": send["p50"], "send_p99_s": send["p99"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Débit et latence du dispatcher de notifications")
+    parser.add_argument("-n", type=int, default=200, help="réservations (2 événements chacune)")
+    parser.add_argument("--recipients", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--delay-ms", type=int, default=50, help="latence du serveur SMTP par message")
+    parser.add_argument("--coalesce-ms", type=int, default=3000)
+    parser.add_argument("--cancel-ratio", type=float, default=0.1)
+    parser.add_argument("--rate-per-min", type=float, default=0, help="0 : pas de limite par destinataire")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    result = asyncio.run(main(args))
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        for k, v in result.items():
+            print(f"{k:16} {v}")
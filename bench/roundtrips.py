@@ -0,0 +1,82 @@
+# ============================================================
+# bench/roundtrips.py — Allers-retours DB par opération
+# ------------------------------------------------------------
+# Lance les quatre services dans ce processus (services/monolith.py :
+# SQLite + broker en mémoire), joue -n réservations complètes l’une
+# après l’autre (création → READY → lecture → check-in → check-out)
+# puis lit sur /metrics :
+#   - http_db_round_trips{route} : requêtes SQL + commits par requête
+#   - consumer_db_round_trips_total / consumer_messages_total : par
+#     message consommé
+# Les valeurs sont des moyennes ; elles ne dépendent pas de la
+# machine, on peut donc les comparer d’un commit à l’autre.
+#
+#   PYTHONPATH=services python bench/roundtrips.py -n 20
+# ============================================================
+import argparse, asyncio, json, random, sys
+from datetime import datetime, timedelta, timezone
+from load import InProcessTarget, FINAL, parse_metrics, _labels
+
+
+async def saga(target, i: int, studio_base: int):
+    booking = target.client("booking")
+    now = datetime.now(timezone.utc)
+    r = await booking.post("/v1/bookings", json={"user_id": studio_base + i, "studio_id": studio_base + i,
+                                                  "start": (now - timedelta(minutes=1)).isoformat(),
+                                                  "end": (now + timedelta(minutes=59)).isoformat()})
+    r.raise_for_status()
+    booking_id = r.json()["id"]
+    view = {}
+    for _ in range(20):
+        view = (await booking.get(f"/v1/bookings/{booking_id}", params={"wait": 5})).json()
+        if view["status"] in FINAL:
+            break
+    if view.get("status") != "READY":
+        return view.get("status")
+    await booking.get(f"/v1/bookings/{booking_id}")
+    (await booking.post(f"/v1/bookings/{booking_id}/checkin", params={"code": view["code"]})).raise_for_status()
+    (await booking.post(f"/v1/bookings/{booking_id}/checkout")).raise_for_status()
+    return "FINISHED"
+
+
+def per_operation(series: dict) -> dict:
+    routes, consumers = {}, {}
+    for key, value in series.items():
+        labels = _labels(key)
+        if key.startswith("http_db_round_trips_sum{"):
+            count = series.get(key.replace("_sum{", "_count{", 1), 0)
+            if count:
+                routes[f"{labels['method']} {labels['route']}"] = {"count": int(count), "mean": round(value / count, 2)}
+        elif key.startswith("consumer_db_round_trips_total{"):
+            messages = series.get(f'consumer_messages_total{{consumer="{labels["consumer"]}"}}', 0)
+            if messages:
+                consumers[labels["consumer"]] = {"count": int(messages), "mean": round(value / messages, 2)}
+    return {"routes": routes, "consumers": consumers}
+
+
+async def main(args):
+    outcomes = {}
+    async with InProcessTarget() as target:
+        for i in range(args.n):
+            status = await saga(target, i, args.studio_base)
+            outcomes[status] = outcomes.get(status, 0) + 1
+        await asyncio.sleep(1)   # derniers messages (notification, status-watch)
+        series = parse_metrics((await target.client("booking").get("/metrics")).text)
+    return {"outcomes": outcomes, **per_operation(series)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Allers-retours DB par opération")
+    parser.add_argument("-n", type=int, default=20, help="réservations jouées")
+    parser.add_argument("--studio-base", type=int, default=random.randint(1, 10**6) * 1000)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    result = asyncio.run(main(args))
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"outcomes: {result['outcomes']}", file=sys.stderr)
+        for kind in ("routes", "consumers"):
+            for name, r in sorted(result[kind].items()):
+                print(f"{name:50} {r['count']:6} {r['mean']:8.2f}")
@@ -0,0 +1,122 @@
+# ============================================================
+# codes.py — Index en mémoire des codes d’accès actifs
+# ------------------------------------------------------------
+# La validation (check-in, portes des studios) ne fait plus de
+# requête DB : on consulte un dict booking_id → code actif.
+#   - chargé au démarrage (codes ACTIVE non expirés)
+#   - alimenté par le consumer après chaque commit (put_many)
+#   - lecture de secours en base si un code est absent de l’index
+#     (code émis par une autre réplique / un worker séparé) ; le
+#     résultat est ensuite gardé dans l’index
+#   - un code expiré est retiré à la première validation qui le voit
+#   - cache négatif : une réservation sans code actif en base n’est
+#     pas relue pendant ACCESS_NEGATIVE_TTL_S secondes (au plus
+#     ACCESS_NEGATIVE_MAX ids, les plus anciens oubliés) ; une saisie
+#     erronée ou un balayage d’ids ne contourne donc pas l’index. Un
+#     code émis par le consumer (put / put_many) efface l’entrée ; émis
+#     par une autre réplique, il est vu au plus tard à l’expiration
+#
+# Les fenêtres sont comparées en UTC aware (les dates lues en base
+# sont des UTC naïfs) et le code avec hmac.compare_digest (temps
+# constant, pas d’indice sur le nombre de chiffres corrects).
+# ============================================================
+import hmac, os, threading, time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from sqlmodel import Session, select
+from models import AccessCode
+
+NEGATIVE_TTL_S = float(os.getenv("ACCESS_NEGATIVE_TTL_S", "5"))
+NEGATIVE_MAX = int(os.getenv("ACCESS_NEGATIVE_MAX", "10000"))
+
+Entry = namedtuple("Entry", ["code", "valid_from", "valid_to"])
+
+
+def as_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+class CodeIndex:
+    def __init__(self, negative_ttl: float = NEGATIVE_TTL_S, negative_max: int = NEGATIVE_MAX):
+        self._codes = {}
+        self._absent = OrderedDict()  # booking_id → échéance (monotonic) du cache négatif
+        self._lock = threading.Lock()
+        self.negative_ttl = negative_ttl
+        self.negative_max = negative_max
+
+    def __len__(self):
+        return len(self._codes)
+
+    def put(self, booking_id: int, code: str, valid_from: datetime, valid_to: datetime):
+        with self._lock:
+            self._codes[booking_id] = Entry(code, as_utc(valid_from), as_utc(valid_to))
+            self._absent.pop(booking_id, None)
+
+    # rows : itérable de (booking_id, code, valid_from, valid_to)
+    def put_many(self, rows):
+        entries = {bid: Entry(code, as_utc(vf), as_utc(vt)) for bid, code, vf, vt in rows}
+        with self._lock:
+            self._codes.update(entries)
+            for bid in entries:
+                self._absent.pop(bid, None)
+
+    def remove(self, booking_id: int):
+        with self._lock:
+            self._codes.pop(booking_id, None)
+
+    def load(self, engine) -> int:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        with Session(engine) as s:
+            rows = s.exec(select(AccessCode.booking_id, AccessCode.code, AccessCode.valid_from, AccessCode.valid_to)
+                          .where(AccessCode.status == "ACTIVE", AccessCode.valid_to >= now)).all()
+        self.put_many(rows)
+        return len(rows)
+
+    # Complète l’index depuis la base pour les ids absents (hors cache
+    # négatif) ; les ids toujours sans code entrent au cache négatif
+    def _fetch_missing(self, engine, booking_ids):
+        now = time.monotonic()
+        with self._lock:
+            missing = [bid for bid in booking_ids if bid not in self._codes and self._absent.get(bid, 0) <= now]
+        if not missing:
+            return
+        with Session(engine) as s:
+            rows = s.exec(select(AccessCode.booking_id, AccessCode.code, AccessCode.valid_from, AccessCode.valid_to)
+                          .where(AccessCode.booking_id.in_(missing), AccessCode.status == "ACTIVE")).all()
+        self.put_many(rows)
+        if self.negative_ttl > 0:
+            found = {r[0] for r in rows}
+            with self._lock:
+                for bid in missing:
+                    if bid not in found:
+                        self._absent[bid] = now + self.negative_ttl
+                        self._absent.move_to_end(bid)
+                while len(self._absent) > self.negative_max:
+                    self._absent.popitem(last=False)
+
+    def _check(self, booking_id: int, code: str, now: datetime) -> bool:
+        e = self._codes.get(booking_id)
+        if e is None:
+            return False
+        if now > e.valid_to:
+            self.remove(booking_id)
+            return False
+        ok = hmac.compare_digest(e.code.encode(), code.encode())
+        return ok and e.valid_from <= now
+
+    def validate(self, engine, booking_id: int, code: str) -> bool:
+        self._fetch_missing(engine, [booking_id])
+        return self._check(booking_id, code, datetime.now(timezone.utc))
+
+    # items : liste de (booking_id, code) → liste de bool, une seule
+    # requête DB au plus pour tous les ids absents de l’index
+    def validate_many(self, engine, items) -> list:
+        self._fetch_missing(engine, {bid for bid, _ in items})
+        now = datetime.now(timezone.utc)
+        return [self._check(bid, code, now) for bid, code in items]
+
+
+# Instance du processus, partagée par l’API et le consumer
+code_index = CodeIndex()
@@ -0,0 +1,52 @@
+# ============================================================
+# sweeper.py — Balayeur du service Access
+# ------------------------------------------------------------
+#   - expire : ACTIVE → EXPIRED pour les codes dont valid_to est
+#     passé (et retrait de l’index en mémoire)
+#   - archive : codes EXPIRED / REVOKED dont valid_to date de plus
+#     de ACCESS_ARCHIVE_AFTER_DAYS jours → table accesscodearchive
+# Par lots bornés, voir common/sweeper.py.
+# ============================================================
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import update
+from sqlmodel import Session, select
+from models import AccessCode, AccessCodeArchive
+from codes import code_index
+from common.sweeper import Sweeper, archive_rows, in_batches
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("ACCESS_ARCHIVE_AFTER_DAYS", "30"))
+
+
+def _utcnow() -> datetime:
+    # colonnes timestamp sans tz, en UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def expire_batch(engine, batch_size: int) -> int:
+    with Session(engine) as s:
+        ids = s.exec(select(AccessCode.booking_id)
+                     .where(AccessCode.status == "ACTIVE", AccessCode.valid_to < _utcnow())
+                     .limit(batch_size)).all()
+        if not ids:
+            return 0
+        s.exec(update(AccessCode).where(AccessCode.booking_id.in_(ids), AccessCode.status == "ACTIVE")
+               .values(status="EXPIRED"))
+        s.commit()
+    for bid in ids:
+        code_index.remove(bid)
+    return len(ids)
+
+
+def archive_batch(engine, batch_size: int) -> int:
+    cutoff = _utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    return archive_rows(engine, AccessCode, AccessCodeArchive, AccessCode.booking_id,
+                        AccessCode.status.in_(("EXPIRED", "REVOKED")) & (AccessCode.valid_to < cutoff),
+                        batch_size)
+
+
+def make_sweeper(engine) -> Sweeper:
+    return Sweeper("access", {
+        "expired": lambda: in_batches(lambda n: expire_batch(engine, n)),
+        "archived": lambda: in_batches(lambda n: archive_batch(engine, n)),
+    })
@@ -0,0 +1,214 @@
+# ============================================================
+# Booking API Router — variante asynchrone
+# ------------------------------------------------------------
+# Mêmes endpoints que api.py mais déclarés en `async def` :
+#   - moteur SQLAlchemy asynchrone (asyncpg) + AsyncSession
+#   - client httpx.AsyncClient partagé (keep-alive / pool)
+#   - événements écrits dans l’outbox (publiés par le relais)
+# Une requête en attente de Postgres, d’Access ou de RabbitMQ
+# n’occupe donc plus un worker du threadpool.
+#
+# Activé par BOOKING_API_MODE=async (voir app.py) pour pouvoir
+# comparer les deux chemins en benchmark.
+# ============================================================
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import Booking, DATABASE_URL
+from repository import AsyncBookingRepository, STREAM_CHUNK
+from cache import booking_cache
+from api import (ACCESS_URL, QUOTA_URL, BATCH_MAX, normalize_times, booking_created_events,
+                 checked_in_events, checked_out_events,
+                 booking_view, as_utc, availability_view, normalize_batch, batch_spans, drop_overlaps,
+                 batch_results, batch_summary, LIST_MAX, listing_filters, listing_view, ndjson_line,
+                 WAIT_MAX, poll_view, status_stream, cached_status)
+from typing import Optional
+from datetime import datetime
+import os, httpx
+from common import tracing
+from common.db import get_async_engine
+
+# URL asyncpg dérivée de DATABASE_URL si ASYNC_DATABASE_URL n’est pas fourni
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+async_engine = get_async_engine(ASYNC_DATABASE_URL)
+router = APIRouter()
+
+# Client HTTP partagé : une seule instance par processus, créée au
+# premier appel et fermée dans le hook "shutdown" (voir shutdown()).
+_http = None
+
+def get_http() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=5,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        )
+    return _http
+
+
+async def shutdown():
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+    await async_engine.dispose()
+
+
+# Dépendance FastAPI : fournit une AsyncSession par requête, auto-close
+async def get_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as s:
+        yield s
+
+# ------------------------------------------------------------
+# POST /v1/bookings — Créer une réservation
+# ------------------------------------------------------------
+@router.post("/v1/bookings", response_model=Booking, status_code=201)
+async def create_booking(b: Booking, s: AsyncSession = Depends(get_session)):
+    normalize_times(b)
+    repo = AsyncBookingRepository(s)
+    if await repo.find_overlap(b.studio_id, b.start, b.end):
+        raise HTTPException(409, "studio already booked for this slot")
+    try:
+        created = await repo.create(b, events=booking_created_events)
+    except IntegrityError:
+        await s.rollback()
+        raise HTTPException(409, "studio already booked for this slot")
+    return created
+
+# ------------------------------------------------------------
+# POST /v1/bookings:batch — Créer des réservations en masse
+# ------------------------------------------------------------
+@router.post("/v1/bookings:batch")
+async def create_bookings_batch(items: list[Booking], s: AsyncSession = Depends(get_session)):
+    if len(items) > BATCH_MAX:
+        raise HTTPException(413, f"at most {BATCH_MAX} bookings per batch")
+    results = [None] * len(items)
+    valid = normalize_batch(items, results)
+
+    repo = AsyncBookingRepository(s)
+    busy = {studio: await repo.list_for_studio(studio, lo, hi) for studio, (lo, hi) in batch_spans(valid).items()}
+    accepted = drop_overlaps(valid, busy, results)
+
+    inserted = await repo.create_many([b for _, b in accepted], events=booking_created_events)
+    batch_results(accepted, inserted, results)
+    return batch_summary(results)
+
+# ------------------------------------------------------------
+# GET /v1/bookings — Lister / exporter les réservations
+# ------------------------------------------------------------
+@router.get("/v1/bookings")
+async def list_bookings(user_id: Optional[int] = None, studio_id: Optional[int] = None, status: Optional[str] = None,
+                        start: Optional[datetime] = Query(None, alias="from"), end: Optional[datetime] = Query(None, alias="to"),
+                        cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=LIST_MAX),
+                        format: str = Query("json", pattern="^(json|ndjson)$"), s: AsyncSession = Depends(get_session)):
+    filters = listing_filters(user_id, studio_id, status, start, end, cursor)
+    if format == "ndjson":
+        async def rows():
+            async with AsyncSession(async_engine, expire_on_commit=False) as export:
+                lines = []
+                async for b in AsyncBookingRepository(export).stream(**filters):
+                    lines.append(ndjson_line(b))
+                    if len(lines) >= STREAM_CHUNK:
+                        yield "".join(lines)
+                        lines = []
+                if lines:
+                    yield "".join(lines)
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+    page = await AsyncBookingRepository(s).list_page(limit + 1, **filters)
+    return listing_view(page, limit)
+
+# ------------------------------------------------------------
+# GET /v1/bookings/{booking_id} — Récupérer une réservation
+# ------------------------------------------------------------
+@router.get("/v1/bookings/{booking_id}")
+async def get_booking(booking_id: int, wait: float = Query(0, ge=0, le=WAIT_MAX)):
+    view = await poll_view(booking_id, wait, lambda: read_view(booking_id))
+    if view is None:
+        raise HTTPException(404, "not found")
+    return view
+
+# ------------------------------------------------------------
+# GET /v1/bookings/{booking_id}/events — Flux SSE des statuts
+# ------------------------------------------------------------
+@router.get("/v1/bookings/{booking_id}/events")
+async def booking_events(booking_id: int):
+    read = lambda: read_view(booking_id)
+    if await read() is None:
+        raise HTTPException(404, "not found")
+    return StreamingResponse(status_stream(booking_id, read), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+# Session courte par lecture (pas de connexion gardée pendant l’attente)
+async def read_view(booking_id: int):
+    async with AsyncSession(async_engine, expire_on_commit=False) as s:
+        return await AsyncBookingRepository(s).get_view(booking_id, booking_view)
+
+# ------------------------------------------------------------
+# GET /v1/cache/stats — Compteurs du cache de lecture
+# ------------------------------------------------------------
+@router.get("/v1/cache/stats")
+async def cache_stats():
+    return booking_cache.stats()
+
+# ------------------------------------------------------------
+# GET /v1/studios/{studio_id}/availability?from=&to=
+# ------------------------------------------------------------
+@router.get("/v1/studios/{studio_id}/availability")
+async def studio_availability(studio_id: int, start: datetime = Query(alias="from"), end: datetime = Query(alias="to"),
+                              s: AsyncSession = Depends(get_session)):
+    start, end = as_utc(start), as_utc(end)
+    if start >= end:
+        raise HTTPException(400, "from must be before to")
+    busy = await AsyncBookingRepository(s).list_for_studio(studio_id, start, end)
+    return availability_view(studio_id, busy, start, end)
+
+# ------------------------------------------------------------
+# POST /v1/bookings/{id}/checkin — Entrée avec code d’accès
+# ------------------------------------------------------------
+async def transition_error(repo: AsyncBookingRepository, booking_id: int, expected: str):
+    b = await repo.get(booking_id)
+    if not b:
+        raise HTTPException(404, "not found")
+    if b.status != expected:
+        raise HTTPException(409, f"not {expected}")
+
+
+@router.post("/v1/bookings/{booking_id}/checkin")
+async def checkin(booking_id: int, code: str, s: AsyncSession = Depends(get_session)):
+    repo = AsyncBookingRepository(s)
+    # rejet sans appel Access (voir api.checkin)
+    if cached_status(booking_id) != "READY":
+        await transition_error(repo, booking_id, "READY")
+    # Validation auprès du service Access (sans bloquer la boucle)
+    r = await get_http().post(f"{ACCESS_URL}/v1/access/validate", params={"bookingId": booking_id, "code": code},
+                                headers=tracing.inject())
+    if r.json().get("valid", False):
+        if await repo.transition(booking_id, "IN_USE", events=checked_in_events, expected=("READY",)):
+            return {"status": "IN_USE"}
+    await transition_error(repo, booking_id, "READY")
+    raise HTTPException(401, "invalid code")
+
+# ------------------------------------------------------------
+# POST /v1/bookings/{id}/checkout — Sortie et commit de quota
+# ------------------------------------------------------------
+@router.post("/v1/bookings/{booking_id}/checkout")
+async def checkout(booking_id: int, s: AsyncSession = Depends(get_session)):
+    repo = AsyncBookingRepository(s)
+    b = await repo.transition(booking_id, "FINISHED", events=checked_out_events, expected=("IN_USE",))
+    if b is None:
+        await transition_error(repo, booking_id, "IN_USE")
+        raise HTTPException(409, "not IN_USE")
+    if b.quota_reservation_id:
+        try:
+            await get_http().post(f"{QUOTA_URL}/v1/quotas/commit", params={"reservationId": int(b.quota_reservation_id)},
+                                    headers=tracing.inject())
+        except Exception:
+            pass
+    return {"status": "FINISHED"}
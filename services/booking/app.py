@@ -5,16 +5,31 @@
 #   - Crée les tables dans la base de données PostgreSQL
 #   - Démarre un thread consommateur RabbitMQ (start_consumer)
 #   - Monte les routes API principales et l’interface web (UI)
+#
+# BOOKING_API_MODE=sync (défaut) → routes `def` (api.py)
+# BOOKING_API_MODE=async         → routes `async def` (api_async.py)
 # ============================================================
 from fastapi import FastAPI
-from sqlmodel import SQLModel
 from api import router, engine
-import threading
+import os, threading
 from consumer import start_consumer
+from watch import start_listener
+from common.outbox import start_relay, stop_relay
+from eventlog import install_journal, snapshot_batch
+from common.sweeper import Sweeper, in_batches
+from common import metrics, tracing
 
 import models
 
+API_MODE = os.getenv("BOOKING_API_MODE", "sync")
+if API_MODE == "async":
+    import api_async
+
 app = FastAPI(title="Booking Service")
+# span par requête + GET /debug/traces/{traceId} (common/tracing.py)
+tracing.instrument_app(app)
+# latence par route + GET /metrics (common/metrics.py)
+metrics.instrument_app(app)
 
 # Exécuté automatiquement par FastAPI au lancement du conteneur.
 # 1️. Crée les tables SQL.
@@ -22,10 +37,33 @@ app = FastAPI(title="Booking Service")
 
 @app.on_event("startup")
 def start():
-    # crée les tables (Booking + ProcessedMessage)
-    SQLModel.metadata.create_all(engine)
+    # crée les tables du service (voir models.TABLES)
+    models.create_tables(engine)
+    # index manquants + contrainte anti-chevauchement (idempotents)
+    models.install_indexes(engine)
+    models.install_columns(engine)
+    models.install_constraints(engine)
+    # base complète dans le journal pour les réservations qui le précèdent
+    install_journal(engine)
     # lance le worker dans un thread
     threading.Thread(target=start_consumer, daemon=True).start()
+    # relais outbox → RabbitMQ
+    start_relay(engine)
+    # instantanés périodiques du journal des réservations
+    Sweeper("booking", {"snapshots": lambda: in_batches(lambda n: snapshot_batch(engine, n))}).start()
+    # réveil des clients en attente (long-poll / SSE) sur les
+    # changements de statut faits par les autres processus
+    threading.Thread(target=start_listener, daemon=True).start()
+
+
+# À l’arrêt : on arrête le relais (lot en cours terminé, connexion
+# RabbitMQ du relais fermée ; les lignes restantes de l’outbox seront
+# publiées au prochain démarrage)
+@app.on_event("shutdown")
+async def stop():
+    if API_MODE == "async":
+        await api_async.shutdown()
+    stop_relay()
 
 
 #  Inclusion du module d’interface utilisateur (UI)
@@ -36,4 +74,10 @@ app.include_router(ui_router)
 
 # Inclusion des routes principales REST (API Booking)
 
-app.include_router(router)
\ No newline at end of file
+app.include_router(api_async.router if API_MODE == "async" else router)
+
+
+# Chronologie d’une réservation à travers les services (saga.py)
+
+from saga import router as saga_router
+app.include_router(saga_router)
\ No newline at end of file
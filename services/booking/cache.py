@@ -0,0 +1,162 @@
+# ============================================================
+# cache.py — Cache de lecture des réservations (read-through)
+# ------------------------------------------------------------
+# Les clients interrogent GET /v1/bookings/{id} en boucle en
+# attendant que PENDING passe à READY. On garde donc la vue
+# "human-friendly" (booking_view, dates déjà converties) :
+#   - en mémoire du processus : LRU borné + TTL (par défaut)
+#   - ou dans Redis (BOOKING_CACHE_URL=redis://...) : partagé par
+#     toutes les répliques API / workers
+#
+# Invalidation : chaque écriture d’une réservation (transition,
+# consumer) supprime l’entrée après le commit (watch.changed). En
+# mode mémoire, les changements de STATUT faits par un autre
+# processus arrivent aussi par les événements Booking* (voir
+# watch.start_listener) ; pour le reste (code, quota), le TTL borne
+# la durée d’une vue périmée — utiliser Redis pour un cache partagé.
+#
+# Lecture concurrente d’une invalidation : get_view lit
+# generation(id) AVANT la requête DB et la repasse à set() ; si
+# delete(id) est passé entre les deux, la vue (peut-être lue avant le
+# commit) n’est pas remise en cache.
+#
+# BOOKING_CACHE_SIZE=0 désactive le cache.
+# ============================================================
+import os, json, time, threading
+from collections import OrderedDict
+
+CACHE_URL = os.getenv("BOOKING_CACHE_URL", "")
+CACHE_SIZE = int(os.getenv("BOOKING_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("BOOKING_CACHE_TTL", "30"))
+# Invalidations récentes mémorisées (mode mémoire)
+CACHE_GENERATIONS = int(os.getenv("BOOKING_CACHE_GENERATIONS", "10000"))
+
+
+# Compteurs communs aux deux backends (propres au processus)
+class CacheStats:
+    hits = 0
+    misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "size": self.size(),
+        }
+
+
+class LRUCache(CacheStats):
+    backend = "memory"
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # clé → (expiration, valeur)
+        self._lock = threading.Lock()
+        # clé → numéro de sa dernière invalidation (LRU borné) ; au-delà
+        # de la borne, _floor garde le plus grand numéro oublié
+        self._invalidated = OrderedDict()
+        self._seq = 0
+        self._floor = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def generation(self, key) -> int:
+        return self._seq
+
+    def set(self, key, value, generation=None):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation is not None and self._invalidated.get(key, self._floor) > generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._seq += 1
+                self._invalidated[key] = self._seq
+                self._invalidated.move_to_end(key)
+            while len(self._invalidated) > CACHE_GENERATIONS:
+                self._floor = max(self._floor, self._invalidated.popitem(last=False)[1])
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class RedisCache(CacheStats):
+    backend = "redis"
+
+    def __init__(self, url: str, ttl: float = CACHE_TTL, prefix: str = "booking:view:"):
+        import redis  # dépendance chargée seulement si ce backend est choisi
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(f"{self.prefix}{key}")
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    # Compteur d’invalidations par clé, gardé plus longtemps que les vues
+    def _gen_key(self, key) -> str:
+        return f"{self.prefix}gen:{key}"
+
+    def generation(self, key) -> int:
+        return int(self.client.get(self._gen_key(key)) or 0)
+
+    def set(self, key, value, generation=None):
+        if generation is None:
+            self.client.set(f"{self.prefix}{key}", json.dumps(value), px=int(self.ttl * 1000))
+            return
+        import redis
+        with self.client.pipeline() as pipe:
+            try:
+                # écriture annulée si le compteur bouge pendant la transaction
+                pipe.watch(self._gen_key(key))
+                if int(pipe.get(self._gen_key(key)) or 0) != generation:
+                    return
+                pipe.multi()
+                pipe.set(f"{self.prefix}{key}", json.dumps(value), px=int(self.ttl * 1000))
+                pipe.execute()
+            except redis.WatchError:
+                pass
+
+    def delete(self, *keys):
+        if keys:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.delete(*(f"{self.prefix}{k}" for k in keys))
+            for k in keys:
+                pipe.incr(self._gen_key(k))
+                pipe.pexpire(self._gen_key(k), int(max(self.ttl, 60) * 10 * 1000))
+            pipe.execute()
+
+    def size(self):
+        # non significatif : la base Redis peut être partagée
+        return None
+
+
+# Instance du processus, partagée par l’API et le consumer
+booking_cache = RedisCache(CACHE_URL) if CACHE_URL else LRUCache()
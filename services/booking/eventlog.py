@@ -0,0 +1,223 @@
+# ============================================================
+# eventlog.py — Journal des réservations, instantanés et rejeu
+# ------------------------------------------------------------
+# Chaque changement d’une réservation passe par
+# BookingRepository.apply() / create() qui appellent record() :
+# l’événement (champs modifiés, msgpack) est ajouté à BookingEvent
+# dans la MÊME transaction que la modification de Booking.
+#
+# Base complète : une réservation n’est reconstructible que si son
+# journal contient un état complet (BookingCreated, écrit à la
+# création). Les réservations antérieures au journal reçoivent à
+# l’installation (install_journal, au démarrage du service) un
+# événement BookingImported portant tout leur état courant.
+#
+# Instantanés : snapshot_batch() replie les nouveaux événements
+# (par ordre d’id, au-delà du plus grand event_id déjà replié) sur
+# l’état de chaque réservation dans BookingSnapshot. Seuls les
+# événements de plus de SNAPSHOT_LAG_S secondes sont repliés, pour
+# ne pas dépasser un id dont la transaction n’est pas encore validée.
+# Lancé périodiquement par le balayeur du service (app.py).
+#
+# Rejeu : replay() découpe l’intervalle des booking_id en plages,
+# une par processus ; chaque processus part des instantanés de sa
+# plage, applique les événements suivants et compare (audit) ou
+# réécrit (--apply) les lignes Booking correspondantes. Seules les
+# réservations ayant une base complète (instantané ou événement de
+# BASE_EVENTS) sont réécrites ; les autres sont laissées en place et
+# comptées comme divergentes.
+#
+#   python eventlog.py snapshot
+#   python eventlog.py replay [--workers N] [--apply]
+# ============================================================
+import os, sys, argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+import msgpack
+from sqlalchemy import delete, exists, func, insert
+from sqlmodel import Session, create_engine, select
+from models import Booking, BookingEvent, BookingSnapshot
+
+SNAPSHOT_LAG_S = float(os.getenv("SNAPSHOT_LAG_S", "60"))
+REPLAY_CHUNK = int(os.getenv("REPLAY_CHUNK", "5000"))
+
+# Colonnes de Booking rejouées (l’id est la clé de l’événement)
+FIELDS = [c.name for c in Booking.__table__.columns if c.name != "id"]
+# Événements portant l’état complet d’une réservation
+BASE_EVENTS = ("BookingCreated", "BookingImported")
+
+
+# ------------------------------------------------------------
+# Encodage msgpack (datetimes → extension timestamp, en UTC)
+# ------------------------------------------------------------
+def _aware(v):
+    if isinstance(v, datetime) and v.tzinfo is None:
+        return v.replace(tzinfo=timezone.utc)
+    return v
+
+
+def pack(fields: dict) -> bytes:
+    return msgpack.packb({k: _aware(v) for k, v in fields.items()}, datetime=True)
+
+
+def unpack(data: bytes) -> dict:
+    return msgpack.unpackb(data, timestamp=3)
+
+
+def state_of(b: Booking) -> dict:
+    return {f: getattr(b, f) for f in FIELDS}
+
+
+# Ajoute un événement au journal (dans la transaction de l’appelant)
+def record(s, booking_id: int, event_type: str, fields: dict):
+    s.add(BookingEvent(booking_id=booking_id, event_type=event_type, data=pack(fields)))
+
+
+# ------------------------------------------------------------
+# Base des réservations antérieures au journal
+# ------------------------------------------------------------
+# Un lot de réservations sans événement de BASE_EVENTS reçoit un
+# BookingImported (état courant complet). Sous Postgres les lignes
+# sont verrouillées : une modification concurrente attend le commit,
+# et son événement suit donc la base dans l’ordre de rejeu.
+def import_batch(engine, batch_size: int) -> int:
+    with Session(engine) as s:
+        based = exists().where(BookingEvent.booking_id == Booking.id, BookingEvent.event_type.in_(BASE_EVENTS))
+        q = select(Booking).where(~based).order_by(Booking.id).limit(batch_size)
+        if engine.dialect.name == "postgresql":
+            q = q.with_for_update()
+        rows = s.exec(q).all()
+        for b in rows:
+            record(s, b.id, "BookingImported", state_of(b))
+        s.commit()
+    return len(rows)
+
+
+# Idempotent : appelé à chaque démarrage (ne trouve plus rien après
+# la première installation)
+def install_journal(engine) -> int:
+    total = 0
+    while (n := import_batch(engine, REPLAY_CHUNK)):
+        total += n
+    if total:
+        print(f"[eventlog] {total} pre-journal bookings imported", flush=True)
+    return total
+
+
+# ------------------------------------------------------------
+# Instantanés
+# ------------------------------------------------------------
+def snapshot_batch(engine, batch_size: int) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=SNAPSHOT_LAG_S)
+    with Session(engine) as s:
+        watermark = s.exec(select(func.coalesce(func.max(BookingSnapshot.event_id), 0))).one()
+        events = s.exec(select(BookingEvent)
+                        .where(BookingEvent.id > watermark, BookingEvent.recorded_at < cutoff)
+                        .order_by(BookingEvent.id).limit(batch_size)).all()
+        if not events:
+            return 0
+        ids = {e.booking_id for e in events}
+        snaps = {sn.booking_id: sn for sn in s.exec(select(BookingSnapshot).where(BookingSnapshot.booking_id.in_(ids)))}
+        states = {bid: unpack(sn.data) for bid, sn in snaps.items()}
+        last = {}
+        for e in events:
+            states.setdefault(e.booking_id, {}).update(unpack(e.data))
+            last[e.booking_id] = e.id
+        for bid, state in states.items():
+            sn = snaps.get(bid)
+            if sn is None:
+                s.add(BookingSnapshot(booking_id=bid, event_id=last[bid], data=pack(state)))
+            else:
+                sn.event_id, sn.data, sn.taken_at = last[bid], pack(state), datetime.now(timezone.utc)
+        s.commit()
+    return len(events)
+
+
+# ------------------------------------------------------------
+# Rejeu
+# ------------------------------------------------------------
+# Renvoie (états des réservations ayant une base complète, ids dont
+# le journal ne contient que des changements partiels)
+def project(s: Session, lo: int, hi: int):
+    states, based = {}, set()
+    for sn in s.exec(select(BookingSnapshot).where(BookingSnapshot.booking_id.between(lo, hi))):
+        states[sn.booking_id] = (sn.event_id, unpack(sn.data))
+        based.add(sn.booking_id)
+    q = (select(BookingEvent).where(BookingEvent.booking_id.between(lo, hi))
+         .order_by(BookingEvent.booking_id, BookingEvent.id).execution_options(yield_per=REPLAY_CHUNK))
+    for e in s.exec(q):
+        last, state = states.get(e.booking_id, (0, {}))
+        if e.id <= last:
+            continue
+        state.update(unpack(e.data))
+        states[e.booking_id] = (e.id, state)
+        if e.event_type in BASE_EVENTS:
+            based.add(e.booking_id)
+    return {bid: state for bid, (_, state) in states.items() if bid in based}, set(states) - based
+
+
+def _same(a, b) -> bool:
+    return _aware(a) == _aware(b)
+
+
+# Une plage [lo, hi] : renvoie (réservations projetées, lignes divergentes).
+# --apply ne supprime et ne réinsère que les réservations projetées ;
+# celles sans base complète restent telles quelles (divergentes).
+def replay_range(url: str, lo: int, hi: int, apply: bool):
+    engine = create_engine(url)
+    with Session(engine) as s:
+        states, partial = project(s, lo, hi)
+        if apply:
+            ids = sorted(states)
+            for i in range(0, len(ids), REPLAY_CHUNK):
+                s.exec(delete(Booking).where(Booking.id.in_(ids[i:i + REPLAY_CHUNK])))
+            rows = [{"id": bid, **{f: state.get(f) for f in FIELDS}} for bid, state in states.items()]
+            for i in range(0, len(rows), REPLAY_CHUNK):
+                s.exec(insert(Booking), params=rows[i:i + REPLAY_CHUNK])
+            s.commit()
+            diverging = len(partial)
+        else:
+            current = {b.id: b for b in s.exec(select(Booking).where(Booking.id.between(lo, hi)))}
+            diverging = sum(1 for bid in set(states) | set(current)
+                            if bid not in states or bid not in current
+                            or not all(_same(states[bid].get(f), getattr(current[bid], f)) for f in FIELDS))
+    engine.dispose()
+    return len(states), diverging
+
+
+def replay(url: str, workers: int = os.cpu_count() or 1, apply: bool = False):
+    engine = create_engine(url)
+    with Session(engine) as s:
+        lo, hi = s.exec(select(func.min(BookingEvent.booking_id), func.max(BookingEvent.booking_id))).one()
+    engine.dispose()
+    if lo is None:
+        return 0, 0
+    step = (hi - lo) // workers + 1
+    ranges = [(a, min(a + step - 1, hi)) for a in range(lo, hi + 1, step)]
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        results = list(pool.map(replay_range, [url] * len(ranges), *zip(*ranges), [apply] * len(ranges)))
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Journal des réservations")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("snapshot", help="replie tout le journal dans les instantanés")
+    rp = sub.add_parser("replay", help="reconstruit la table booking depuis le journal")
+    rp.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    rp.add_argument("--apply", action="store_true", help="réécrit la table (sinon : audit seulement)")
+    args = parser.parse_args()
+
+    from models import DATABASE_URL, engine, create_tables
+    create_tables(engine)
+    install_journal(engine)
+    if args.cmd == "snapshot":
+        total = 0
+        while (n := snapshot_batch(engine, REPLAY_CHUNK)):
+            total += n
+        print(f"[eventlog] {total} events folded into snapshots", flush=True)
+    else:
+        n, diverging = replay(DATABASE_URL, args.workers, args.apply)
+        verb = "rewrote" if args.apply else "checked"
+        print(f"[eventlog] {verb} {n} bookings with {args.workers} workers, {diverging} diverging", flush=True)
+        sys.exit(1 if diverging else 0)
@@ -6,29 +6,345 @@
 # des données de la couche API.
 # ============================================================
 from sqlmodel import Session, select
-from models import Booking   
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import and_, case, func, true, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timezone
+import os
+from models import Booking, sources
+from cache import booking_cache
+from watch import changed
+from common.outbox import enqueue_many, kick
+from eventlog import record, state_of
+
+# Taille des paquets lus par le curseur serveur en mode export
+STREAM_CHUNK = int(os.getenv("BOOKING_STREAM_CHUNK", "1000"))
+
+
+# Les colonnes start/end sont des timestamps sans tz stockés en UTC :
+# on compare donc avec des datetimes UTC naïfs.
+def _utc_naive(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+# Réservations non annulées d’un studio qui chevauchent [start, end).
+# Sur Postgres, le prédicat tsrange && est servi par l’index GiST de la
+# contrainte booking_no_overlap ; ailleurs on compare les bornes
+# (index ix_booking_studio_start).
+def overlapping(dialect: str, studio_id: int, start: datetime, end: datetime):
+    start, end = _utc_naive(start), _utc_naive(end)
+    q = select(Booking).where(Booking.studio_id == studio_id, Booking.status != "CANCELLED")
+    if dialect == "postgresql":
+        q = q.where(func.tsrange(Booking.start, Booking.end).op("&&")(func.tsrange(start, end)))
+    else:
+        q = q.where(Booking.start < end, Booking.end > start)
+    return q.order_by(Booking.start)
+
+
+# Listing filtré, du plus récent au plus ancien, paginé par clé
+# (keyset) : before_id = dernier id de la page précédente. Chaque
+# filtre + ORDER BY id DESC est servi par un index composite
+# (user_id, id) / (studio_id, id) / (status, id), sans OFFSET.
+def listing(user_id=None, studio_id=None, status=None, start=None, end=None, before_id=None):
+    q = select(Booking)
+    if user_id is not None:
+        q = q.where(Booking.user_id == user_id)
+    if studio_id is not None:
+        q = q.where(Booking.studio_id == studio_id)
+    if status is not None:
+        q = q.where(Booking.status == status)
+    if start is not None:
+        q = q.where(Booking.start >= _utc_naive(start))
+    if end is not None:
+        q = q.where(Booking.start < _utc_naive(end))
+    if before_id is not None:
+        q = q.where(Booking.id < before_id)
+    return q.order_by(Booking.id.desc())
+
+
+# Transition conditionnelle (compare-and-set) en une requête :
+#   UPDATE booking SET status=:to, ... WHERE id=:id
+#     AND status IN (:expected) RETURNING *
+# `expected` : statuts de départ, par défaut tous ceux depuis
+# lesquels la machine à états (models.TRANSITIONS) atteint `to`.
+def transition_stmt(booking_id: int, to: str, expected=None, **fields):
+    allowed = sources(to)
+    expected = tuple(expected or allowed)
+    if not set(expected) <= set(allowed):
+        raise ValueError(f"invalid transition {expected} -> {to}")
+    return (update(Booking)
+            .where(Booking.id == booking_id, Booking.status.in_(expected))
+            .values(status=to, **fields)
+            .returning(Booking)
+            .execution_options(populate_existing=True))
+
+
+# Confirmation d’une moitié (code d’accès OU réservation de quota) sur
+# une réservation PENDING ; passe à READY dans la même requête si
+# l’autre moitié est déjà enregistrée. Sans lecture préalable, deux
+# confirmations concurrentes ne peuvent pas laisser la réservation
+# en PENDING : la seconde voit la ligne écrite par la première.
+def confirm_stmt(booking_id: int, **fields):
+    missing = [c.isnot(None) for c in (Booking.code, Booking.quota_reservation_id) if c.key not in fields]
+    ready = and_(*missing) if missing else true()
+    return (update(Booking)
+            .where(Booking.id == booking_id, Booking.status == "PENDING")
+            .values(status=case((ready, "READY"), else_=Booking.status), **fields)
+            .returning(Booking)
+            .execution_options(populate_existing=True))
 
 
 # BookingRepository
 # Fournit des méthodes CRUD simplifiées sur la table Booking. Utilisé à la fois par les routes FastAPI et le consumer RabbitMQ.
+# Les méthodes d’écriture acceptent `events` : fonction booking →
+# [(event_type, payload[, partition_key])], écrits dans l’Outbox
+# dans la même transaction que la réservation (voir common/outbox.py).
+# Tout changement d’une réservation passe par create / apply /
+# transition / confirm, qui l’ajoutent aussi au journal BookingEvent
+# (voir eventlog.py).
 class BookingRepository:
     def __init__(self, session: Session):
         self.session = session
 
 
-    def create(self, b: Booking):
+    def create(self, b: Booking, events=None):
         self.session.add(b)
+        self.session.flush()  # id attribué, utilisé dans le journal et le payload
+        record(self.session, b.id, "BookingCreated", state_of(b))
+        if events:
+            enqueue_many(self.session, events(b))
         self.session.commit()
+        if events:
+            kick()
         self.session.refresh(b)
+        changed(b.id)
         return b
 
+    # Insertion multi-lignes (INSERT ... VALUES (...), (...) RETURNING id
+    # via l’insertmanyvalues de SQLAlchemy 2) en un seul commit.
+    # Si la contrainte d’exclusion rejette le lot (création concurrente),
+    # on rejoue ligne par ligne dans des savepoints pour ne refuser que
+    # les lignes en conflit. Renvoie un booléen par réservation.
+    def create_many(self, bookings: list, events=None) -> list:
+        if not bookings:
+            return []
+        self.session.add_all(bookings)
+        try:
+            self.session.flush()
+            for b in bookings:
+                record(self.session, b.id, "BookingCreated", state_of(b))
+                if events:
+                    enqueue_many(self.session, events(b))
+            self.session.commit()
+            kick()
+            for b in bookings:
+                self.session.refresh(b)
+            changed(*(b.id for b in bookings))
+            return [True] * len(bookings)
+        except IntegrityError:
+            self.session.rollback()
+        ok = []
+        for b in bookings:
+            try:
+                with self.session.begin_nested():
+                    self.session.add(b)
+                    self.session.flush()
+                    record(self.session, b.id, "BookingCreated", state_of(b))
+                    if events:
+                        enqueue_many(self.session, events(b))
+                ok.append(True)
+            except IntegrityError:
+                ok.append(False)
+        self.session.commit()
+        kick()
+        for b, inserted in zip(bookings, ok):
+            if inserted:
+                self.session.refresh(b)
+        changed(*(b.id for b, inserted in zip(bookings, ok) if inserted))
+        return ok
+
     def get(self, booking_id: int):
         return self.session.exec(select(Booking).where(Booking.id == booking_id)).first()
 
-    def update_status(self, booking_id: int, status: str):
-        b = self.get(booking_id)
-        if b:
-            b.status = status
-            self.session.commit()
-            self.session.refresh(b)
-        return b
\ No newline at end of file
+    # Lecture via le cache (read-through) : renvoie render(booking),
+    # la vue est mise en cache ; None si la réservation n’existe pas
+    def get_view(self, booking_id: int, render):
+        view = booking_cache.get(booking_id)
+        if view is None:
+            generation = booking_cache.generation(booking_id)
+            b = self.get(booking_id)
+            if not b:
+                return None
+            view = render(b)
+            booking_cache.set(booking_id, view, generation)
+        return view
+
+    def find_overlap(self, studio_id: int, start: datetime, end: datetime):
+        dialect = self.session.get_bind().dialect.name
+        return self.session.exec(overlapping(dialect, studio_id, start, end).limit(1)).first()
+
+    def list_for_studio(self, studio_id: int, start: datetime, end: datetime):
+        dialect = self.session.get_bind().dialect.name
+        return self.session.exec(overlapping(dialect, studio_id, start, end)).all()
+
+    # Une page de `limit` réservations (filtres : voir listing())
+    def list_page(self, limit: int, **filters):
+        return self.session.exec(listing(**filters).limit(limit)).all()
+
+    # Itère sur toutes les réservations filtrées par paquets de
+    # STREAM_CHUNK lignes (curseur serveur sur Postgres) : la mémoire
+    # reste bornée quel que soit le volume exporté.
+    def stream(self, **filters):
+        q = listing(**filters).execution_options(yield_per=STREAM_CHUNK)
+        yield from self.session.exec(q)
+
+    # Modifie les champs d’une réservation chargée dans la session et
+    # journalise le changement (sans commit)
+    def apply(self, b: Booking, event_type: str, **fields):
+        for k, v in fields.items():
+            setattr(b, k, v)
+        record(self.session, b.id, event_type, fields)
+
+    # Transition de statut (transition_stmt) + journal + outbox, un
+    # seul commit. Renvoie la réservation telle qu’écrite (détachée :
+    # lisible sans requête après le commit), ou None si elle n’existe
+    # pas ou n’est plus dans un statut de départ (rien n’est écrit).
+    # commit=False : dans la transaction de l’appelant (lot du consumer).
+    def transition(self, booking_id: int, to: str, event_type: str = "StatusChanged", events=None,
+                   expected=None, commit: bool = True, **fields):
+        b = self.session.exec(transition_stmt(booking_id, to, expected, **fields)).scalars().first()
+        if b is None:
+            return None
+        record(self.session, b.id, event_type, {"status": to, **fields})
+        if not commit:
+            return b
+        if events:
+            enqueue_many(self.session, events(b))
+        self.session.expunge(b)
+        self.session.commit()
+        if events:
+            kick()
+        changed(booking_id)
+        return b
+
+    # Enregistre le code d’accès ou la réservation de quota (confirm_stmt),
+    # journalisé ; sans commit (lot du consumer). None si la réservation
+    # n’est pas (plus) PENDING.
+    def confirm(self, booking_id: int, event_type: str, **fields):
+        b = self.session.exec(confirm_stmt(booking_id, **fields)).scalars().first()
+        if b is not None:
+            record(self.session, b.id, event_type, fields)
+            if b.status == "READY":
+                record(self.session, b.id, "BookingReady", {"status": "READY"})
+        return b
+
+# AsyncBookingRepository
+# Même contrat que BookingRepository mais sur une AsyncSession.
+# Utilisé par le routeur asynchrone (api_async.py).
+class AsyncBookingRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def create(self, b: Booking, events=None):
+        self.session.add(b)
+        await self.session.flush()
+        record(self.session, b.id, "BookingCreated", state_of(b))
+        if events:
+            enqueue_many(self.session, events(b))
+        await self.session.commit()
+        if events:
+            kick()
+        await self.session.refresh(b)
+        changed(b.id)
+        return b
+
+    async def create_many(self, bookings: list, events=None) -> list:
+        if not bookings:
+            return []
+        self.session.add_all(bookings)
+        try:
+            await self.session.flush()
+            for b in bookings:
+                record(self.session, b.id, "BookingCreated", state_of(b))
+                if events:
+                    enqueue_many(self.session, events(b))
+            await self.session.commit()
+            kick()
+            for b in bookings:
+                await self.session.refresh(b)
+            changed(*(b.id for b in bookings))
+            return [True] * len(bookings)
+        except IntegrityError:
+            await self.session.rollback()
+        ok = []
+        for b in bookings:
+            try:
+                async with self.session.begin_nested():
+                    self.session.add(b)
+                    await self.session.flush()
+                    record(self.session, b.id, "BookingCreated", state_of(b))
+                    if events:
+                        enqueue_many(self.session, events(b))
+                ok.append(True)
+            except IntegrityError:
+                ok.append(False)
+        await self.session.commit()
+        kick()
+        for b, inserted in zip(bookings, ok):
+            if inserted:
+                await self.session.refresh(b)
+        changed(*(b.id for b, inserted in zip(bookings, ok) if inserted))
+        return ok
+
+    async def get(self, booking_id: int):
+        return (await self.session.exec(select(Booking).where(Booking.id == booking_id))).first()
+
+    async def get_view(self, booking_id: int, render):
+        view = booking_cache.get(booking_id)
+        if view is None:
+            generation = booking_cache.generation(booking_id)
+            b = await self.get(booking_id)
+            if not b:
+                return None
+            view = render(b)
+            booking_cache.set(booking_id, view, generation)
+        return view
+
+    async def find_overlap(self, studio_id: int, start: datetime, end: datetime):
+        dialect = self.session.bind.dialect.name
+        return (await self.session.exec(overlapping(dialect, studio_id, start, end).limit(1))).first()
+
+    async def list_for_studio(self, studio_id: int, start: datetime, end: datetime):
+        dialect = self.session.bind.dialect.name
+        return (await self.session.exec(overlapping(dialect, studio_id, start, end))).all()
+
+    async def list_page(self, limit: int, **filters):
+        return (await self.session.exec(listing(**filters).limit(limit))).all()
+
+    async def stream(self, **filters):
+        q = listing(**filters).execution_options(yield_per=STREAM_CHUNK)
+        result = await self.session.stream(q)
+        async for b in result.scalars():
+            yield b
+
+    def apply(self, b: Booking, event_type: str, **fields):
+        for k, v in fields.items():
+            setattr(b, k, v)
+        record(self.session, b.id, event_type, fields)
+
+    async def transition(self, booking_id: int, to: str, event_type: str = "StatusChanged", events=None,
+                         expected=None, **fields):
+        b = (await self.session.exec(transition_stmt(booking_id, to, expected, **fields))).scalars().first()
+        if b is None:
+            return None
+        record(self.session, b.id, event_type, {"status": to, **fields})
+        if events:
+            enqueue_many(self.session, events(b))
+        self.session.expunge(b)
+        await self.session.commit()
+        if events:
+            kick()
+        changed(booking_id)
+        return b
@@ -0,0 +1,75 @@
+# ============================================================
+# saga.py — Chronologie d’une réservation (débogage)
+# ------------------------------------------------------------
+# GET /debug/saga/{bookingId}
+#   1. retrouve les traces de la réservation (spans du processus
+#      étiquetés bookingId : création, check-in, check-out...)
+#   2. rassemble les spans de chaque trace : ceux du processus +
+#      ceux des autres services (GET /debug/traces/{traceId})
+#   3. renvoie, par trace, la chronologie des étapes : décalage
+#      depuis le début, durée, service, profondeur dans l’arbre et,
+#      pour un message consommé, le temps passé dans la file
+#      (fin de la publication → début du traitement)
+#
+# Seuls les exportateurs relisibles (memory, file) sont consultés ;
+# un service injoignable est listé dans "unreachable".
+# ============================================================
+import os, httpx
+from fastapi import APIRouter, HTTPException
+from api import ACCESS_URL, QUOTA_URL
+from common import tracing
+
+NOTIFICATION_URL = os.getenv("NOTIFICATION_URL", "http://notification:8004")
+SAGA_SERVICES = {"access": ACCESS_URL, "quota": QUOTA_URL, "notification": NOTIFICATION_URL}
+
+router = APIRouter()
+
+
+def remote_spans(trace_id: str, unreachable: set) -> list:
+    spans = []
+    for name, url in SAGA_SERVICES.items():
+        try:
+            r = httpx.get(f"{url}/debug/traces/{trace_id}", timeout=2)
+            r.raise_for_status()
+            spans += r.json()["spans"]
+        except Exception:
+            unreachable.add(name)
+    return spans
+
+
+def timeline(spans: list) -> dict:
+    by_id = {d["spanId"]: d for d in spans}
+
+    def depth(d):
+        n = 0
+        while d["parentId"] in by_id and n < 64:
+            d, n = by_id[d["parentId"]], n + 1
+        return n
+
+    t0 = min(d["start"] for d in spans)
+    t1 = max(d["start"] + d["durationMs"] / 1000 for d in spans)
+    steps = []
+    for d in sorted(spans, key=lambda d: d["start"]):
+        parent = by_id.get(d["parentId"])
+        queued = None
+        if d["kind"] == "consumer" and parent is not None:
+            # la confirmation du broker peut finir après le début du traitement
+            queued = max(0.0, round((d["start"] - parent["start"]) * 1000 - parent["durationMs"], 3))
+        steps.append({"offsetMs": round((d["start"] - t0) * 1000, 3), "durationMs": d["durationMs"],
+                      "service": d["service"], "name": d["name"], "depth": depth(d), "queuedMs": queued,
+                      "attrs": d["attrs"], "error": d["error"]})
+    return {"start": t0, "totalMs": round((t1 - t0) * 1000, 3), "services": sorted({d["service"] for d in spans}),
+            "steps": steps}
+
+
+@router.get("/debug/saga/{booking_id}")
+def saga(booking_id: int):
+    trace_ids = tracing.find("bookingId", booking_id)
+    if not trace_ids:
+        raise HTTPException(404, "no trace recorded for this booking")
+    unreachable, traces = set(), []
+    for trace_id in trace_ids:
+        spans = {d["spanId"]: d for d in tracing.spans(trace_id) + remote_spans(trace_id, unreachable)}
+        traces.append({"traceId": trace_id, **timeline(list(spans.values()))})
+    traces.sort(key=lambda t: t["start"])
+    return {"bookingId": booking_id, "traces": traces, "unreachable": sorted(unreachable)}
@@ -8,25 +8,48 @@
 #  - création de réservation (create_booking)
 #  - check-in (vérification du code d’accès)
 #  - check-out (libération du studio)
+#
+# Rendu par fragments :
+#  - /ui rend la page complète (UI_ROWS dernières réservations) avec
+#    un ETag faible tiré du contenu des lignes affichées (relues en une
+#    requête) ; un navigateur qui renvoie le même If-None-Match reçoit
+#    304 sans rendu du gabarit
+#  - check-in / check-out ne renvoient que la ligne modifiée
+#    (templates/row.html), échangée sur place par HTMX
+#  - /ui/events (SSE) pousse les lignes modifiées à toutes les
+#    consoles ouvertes, y compris les créations (voir RowFeed)
 # ============================================================
 
-from fastapi import APIRouter, Request, Depends, Form
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Request, Depends, Form, Header
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
 from models import Booking
 from repository import BookingRepository
-from api import engine, create_booking, checkin, checkout  # on réutilise la logique existante
+from watch import status_watch
+from api import engine, create_booking, checkin, checkout, SSE_PING  # on réutilise la logique existante
 from datetime import datetime
+from typing import Optional
 
 from datetime import timezone
 from zoneinfo import ZoneInfo
-import os
+import asyncio, hashlib, os, uuid
 
 
 LOCAL_TZ = ZoneInfo(os.getenv("LOCAL_TZ", "America/Toronto"))
 
-templates = Jinja2Templates(directory="templates")
+# Nombre de réservations affichées par /ui
+UI_ROWS = int(os.getenv("UI_ROWS", "20"))
+# Fenêtre de regroupement des changements poussés (ms) : une rafale de
+# modifications donne une seule relecture et un seul rendu par ligne
+UI_PUSH_MS = int(os.getenv("UI_PUSH_MS", "200"))
+# Lots en attente par console ; au-delà (console trop lente) son flux
+# est fermé et le navigateur se reconnecte avec un rattrapage
+UI_PUSH_BACKLOG = int(os.getenv("UI_PUSH_BACKLOG", "64"))
+
+# Préfixe des ETag : change à chaque démarrage (nouveaux gabarits)
+BOOT = uuid.uuid4().hex[:8]
 
 def to_local(dt):
     if dt is None:
@@ -38,10 +61,10 @@ def to_local(dt):
     return dt.astimezone(LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S")
 
 
-# 👉 enregistre le filtre pour les templates
-# templates.env.filters["to_local"] = to_local
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+# relatif au module (et non au répertoire courant : services/monolith.py)
+templates = Jinja2Templates(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+templates.env.globals["to_local"] = to_local
 
 
 # Gestion de la session SQLModel
@@ -50,19 +73,48 @@ def get_session():
     with Session(engine) as s:
         yield s
 
+
+def recent(s: Session):
+    return s.exec(select(Booking).order_by(Booking.id.desc()).limit(UI_ROWS)).all()
+
+
+def render_row(b: Booking) -> str:
+    return templates.get_template("row.html").render(r=b)
+
+
+# ETag des lignes affichées : tiré de la base et non d’un compteur du
+# processus, il change aussi quand un autre processus (worker, autre
+# réplique) a modifié une ligne sans notifier celui-ci (code d’accès,
+# id de réservation quota...).
+def etag_of(rows) -> str:
+    digest = hashlib.blake2b(digest_size=12)
+    for b in rows:
+        digest.update(repr([getattr(b, c.name) for c in Booking.__table__.columns]).encode())
+    return f'W/"{BOOT}.{digest.hexdigest()}"'
+
+
 # Page principale de la UI
+# La version est lue AVANT les lignes : un changement survenu entre
+# les deux est rattrapé par /ui/events à la connexion du flux.
 @router.get("/ui", response_class=HTMLResponse)
 def ui_home(request: Request, s: Session = Depends(get_session)):
-    # liste des 20 dernières réservations
-    rows = s.exec(select(Booking).order_by(Booking.id.desc()).limit(20)).all()
-    return templates.TemplateResponse("index.html", {"request": request, "rows": rows, "to_local": to_local})
+    version = status_watch.version
+    # liste des dernières réservations
+    rows = recent(s)
+    etag = etag_of(rows)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in (t.strip() for t in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    return templates.TemplateResponse("index.html", {"request": request, "rows": rows, "version": version,
+                                                     "newest": rows[0].id if rows else 0}, headers=headers)
 
 
 # Création d’une réservation via le formulaire HTML
-# On récupère les champs du formulaire, crée un Booking et renvoie le tableau mis à jour.
+# On récupère les champs du formulaire et crée un Booking ; la nouvelle
+# ligne arrive ensuite par /ui/events, sur cette console comme sur les
+# autres (pas de doublon à réconcilier côté navigateur).
 @router.post("/ui/create", response_class=HTMLResponse)
 def ui_create(
-    request: Request,
     user_id: int = Form(...),
     studio_id: int = Form(...),
     start: str = Form(...),
@@ -75,19 +127,17 @@ def ui_create(
         start=datetime.fromisoformat(start),
         end=datetime.fromisoformat(end),
     )
-    created = create_booking(b, s)  # réutilise l’API interne
-    rows = s.exec(select(Booking).order_by(Booking.id.desc()).limit(20)).all()
-    return templates.TemplateResponse("table.html", {"request": request, "rows": rows, "to_local": to_local})
+    create_booking(b, s)  # réutilise l’API interne
+    return HTMLResponse("")
 
 
 # Check-in d’une réservation
 # On vérifie le code d’accès auprès du service Access via API interne.
-# Si le code est valide on met le statut à IN_USE.
+# Si le code est valide on met le statut à IN_USE et on renvoie la ligne.
 @router.post("/ui/checkin/{booking_id}", response_class=HTMLResponse)
 def ui_checkin(booking_id: int, code: str = Form(...), s: Session = Depends(get_session)):
     checkin(booking_id, code, s)
-    rows = s.exec(select(Booking).order_by(Booking.id.desc()).limit(20)).all()
-    return templates.TemplateResponse("table.html", {"request": None, "rows": rows, "to_local": to_local})
+    return HTMLResponse(render_row(BookingRepository(s).get(booking_id)))
 
 # Check-out d’une réservation
 # On informe le service Quota pour finaliser la consommation, puis màj le statut à FINISHED.
@@ -95,5 +145,126 @@ def ui_checkin(booking_id: int, code: str = Form(...), s: Session = Depends(get_
 @router.post("/ui/checkout/{booking_id}", response_class=HTMLResponse)
 def ui_checkout(booking_id: int, s: Session = Depends(get_session)):
     checkout(booking_id, s)
-    rows = s.exec(select(Booking).order_by(Booking.id.desc()).limit(20)).all()
-    return templates.TemplateResponse("table.html", {"request": None, "rows": rows, "to_local": to_local})
\ No newline at end of file
+    return HTMLResponse(render_row(BookingRepository(s).get(booking_id)))
+
+
+# ------------------------------------------------------------
+# Flux des lignes modifiées
+# ------------------------------------------------------------
+# Un seul lecteur par processus, quel que soit le nombre de consoles :
+# les ids notifiés (status_watch.listen : ce processus + les autres via
+# le listener de watch.py) sont regroupés pendant UI_PUSH_MS, relus en
+# une requête, rendus une fois, puis le lot [(id, html)] est remis à
+# chaque console connectée.
+# ------------------------------------------------------------
+class RowFeed:
+    def __init__(self):
+        self.clients = set()   # {asyncio.Queue}
+        self.pending = set()   # ids modifiés depuis le dernier lot
+        self.wakeup = None
+        self.task = None
+
+    def _changed(self, booking_ids):
+        self.pending.update(booking_ids)
+        self.wakeup.set()
+
+    def subscribe(self) -> asyncio.Queue:
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            status_watch.listen(self._changed)
+            self.task = asyncio.create_task(self._pump())
+        q = asyncio.Queue(maxsize=UI_PUSH_BACKLOG)
+        self.clients.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self.clients.discard(q)
+
+    async def _pump(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(UI_PUSH_MS / 1000)
+            self.wakeup.clear()
+            ids, self.pending = self.pending, set()
+            if not self.clients:
+                continue
+            version = status_watch.version
+            try:
+                batch = await run_in_threadpool(render_rows, ids)
+            except Exception as e:
+                print(f"[ui] row feed error: {e}", flush=True)
+                continue
+            for q in list(self.clients):
+                if q.full():
+                    # console trop lente : fin de son flux (None)
+                    self.clients.discard(q)
+                    q.get_nowait()
+                    q.put_nowait(None)
+                else:
+                    q.put_nowait((version, batch))
+
+
+def render_rows(ids=None) -> list:
+    with Session(engine) as s:
+        if ids is None:
+            rows = recent(s)
+        else:
+            rows = s.exec(select(Booking).where(Booking.id.in_(ids))).all()
+        return sorted((b.id, render_row(b)) for b in rows)
+
+
+# Instance du processus
+row_feed = RowFeed()
+
+
+def sse(event: str, html: str, last_id: str) -> str:
+    data = "".join(f"data: {line}\n" for line in html.splitlines())
+    return f"id: {last_id}\nevent: {event}\n{data}\n"
+
+
+# Événements par ligne : "booking-{id}" remplace la ligne affichée,
+# "created" insère en tête une réservation plus récente que `newest`.
+# L’id SSE "version.newest" permet au navigateur qui se reconnecte
+# (Last-Event-ID) de n’être rattrapé que s’il a manqué quelque chose.
+def frames(version: int, batch: list, newest: int):
+    out = []
+    for booking_id, html in batch:
+        event = "created" if booking_id > newest else f"booking-{booking_id}"
+        newest = max(newest, booking_id)
+        out.append(sse(event, html, f"{version}.{newest}"))
+    return "".join(out), newest
+
+
+async def row_events(version: int, newest: int):
+    q = row_feed.subscribe()
+    try:
+        if version != status_watch.version:
+            # changements manqués (entre le rendu de la page et la
+            # connexion, ou pendant une déconnexion) : lignes affichées
+            # renvoyées en une fois
+            version = status_watch.version
+            chunk, newest = frames(version, await run_in_threadpool(render_rows), newest)
+            yield chunk
+        while True:
+            try:
+                item = await asyncio.wait_for(q.get(), SSE_PING)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if item is None:
+                return
+            chunk, newest = frames(*item, newest)
+            yield chunk
+    finally:
+        row_feed.unsubscribe(q)
+
+
+@router.get("/ui/events")
+async def ui_events(after: int = 0, v: int = -1, last_event_id: Optional[str] = Header(None)):
+    if last_event_id:
+        try:
+            v, after = (int(x) for x in last_event_id.split("."))
+        except ValueError:
+            v = -1
+    return StreamingResponse(row_events(v, after), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
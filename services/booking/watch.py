@@ -0,0 +1,139 @@
+# ============================================================
+# watch.py — Attente des changements de statut d’une réservation
+# ------------------------------------------------------------
+# Au lieu de relire GET /v1/bookings/{id} en boucle, un client
+# attend (long-poll ?wait= ou SSE /events) d’être réveillé :
+#   - un attente = un Future asyncio, aucune requête DB ni thread
+#     pendant qu’il dort
+#   - changed(id) retire la vue du cache puis réveille les attentes
+#     de la réservation ; appelable depuis n’importe quel thread
+#     (consumer, routes sync) via call_soon_threadsafe
+#
+# listen(fn) abonne à TOUS les changements (flux de la console UI,
+# voir ui.py) : fn(ids) est appelée dans la boucle de l’abonné.
+# version : compteur incrémenté à chaque notification (ETag de /ui).
+#
+# Appelé par :
+#   - le consumer du processus, après le commit de chaque lot
+#   - BookingRepository.create / transition (création, check-in /
+#     check-out)
+#   - start_listener() : file exclusive du processus liée aux
+#     événements BookingReady / BookingCancelled / BookingChecked*,
+#     pour réveiller aussi les clients quand un AUTRE processus
+#     (worker du profil "scale", autre réplique) a fait le changement ;
+#     et à BookingCreated (UI_EVENTS), remis aux seuls abonnés listen()
+#     (touched) : une création ne change pas de statut et ne doit pas
+#     réveiller les attentes sur PENDING
+# ============================================================
+import asyncio, threading
+from collections import defaultdict
+from cache import booking_cache
+from common.consumer import BatchConsumer
+from common.envelope import decode
+
+# Événements publiés à chaque changement de statut
+STATUS_EVENTS = ["BookingReady", "BookingCancelled", "BookingCheckedIn", "BookingCheckedOut"]
+# Événements sans changement de statut, utiles au seul flux de la UI
+UI_EVENTS = ["BookingCreated"]
+
+
+class StatusWatch:
+    def __init__(self):
+        self._waiters = defaultdict(set)  # booking_id → {(loop, future)}
+        self._listeners = set()           # {(loop, fn)}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    # À appeler AVANT de relire le statut : un changement survenu
+    # entre la lecture et l’attente réveille quand même le Future.
+    def subscribe(self, booking_id: int) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._lock:
+            self._waiters[booking_id].add((loop, fut))
+        return fut
+
+    def unsubscribe(self, booking_id: int, fut: asyncio.Future):
+        with self._lock:
+            waiters = self._waiters.get(booking_id)
+            if waiters is None:
+                return
+            waiters.discard((fut.get_loop(), fut))
+            if not waiters:
+                del self._waiters[booking_id]
+
+    # Renvoie True si réveillé, False à l’expiration du délai
+    async def wait(self, fut: asyncio.Future, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def listen(self, fn):
+        key = (asyncio.get_running_loop(), fn)
+        with self._lock:
+            self._listeners.add(key)
+        return key
+
+    def unlisten(self, key):
+        with self._lock:
+            self._listeners.discard(key)
+
+    # wake=False : abonnés listen() seulement, attentes laissées en place
+    def notify(self, *booking_ids, wake: bool = True):
+        with self._lock:
+            woken = [w for bid in booking_ids for w in self._waiters.pop(bid, ())] if wake else []
+            listeners = list(self._listeners)
+            self.version += 1
+        for loop, fut in woken:
+            loop.call_soon_threadsafe(_wake, fut)
+        for loop, fn in listeners:
+            loop.call_soon_threadsafe(fn, booking_ids)
+
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(w) for w in self._waiters.values())
+
+
+def _wake(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(True)
+
+
+# Instance du processus
+status_watch = StatusWatch()
+
+
+# Une réservation a changé (après commit) : vue du cache périmée,
+# clients en attente réveillés
+def changed(*booking_ids):
+    ids = [bid for bid in booking_ids if bid is not None]
+    if ids:
+        booking_cache.delete(*ids)
+        status_watch.notify(*ids)
+
+
+# Réservation créée par un autre processus : seulement le flux de la UI
+def touched(*booking_ids):
+    ids = [bid for bid in booking_ids if bid is not None]
+    if ids:
+        status_watch.notify(*ids, wake=False)
+
+
+def on_status_events(batch):
+    ids, created = set(), set()
+    for d in batch:
+        try:
+            evt = decode(d.body, d.properties)
+        except ValueError:
+            continue
+        (created if evt.type in UI_EVENTS else ids).add(evt.payload.get("bookingId"))
+    changed(*ids)
+    touched(*(created - ids))
+
+
+# File exclusive (nommée par le broker, supprimée à la déconnexion) :
+# chaque processus API reçoit TOUS les changements de statut
+def start_listener():
+    BatchConsumer("status-watch", None, STATUS_EVENTS + UI_EVENTS, batch_handler=on_status_events).run()
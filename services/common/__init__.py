@@ -0,0 +1,6 @@
+# ============================================================
+# common — Code partagé entre les microservices
+# ------------------------------------------------------------
+# Copié dans chaque image Docker (/app/common) via le contexte de
+# build additionnel "common" déclaré dans docker-compose.yml.
+# ============================================================
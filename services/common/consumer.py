@@ -0,0 +1,208 @@
+# ============================================================
+# consumer.py — Runtime de consommation RabbitMQ (module partagé)
+# ------------------------------------------------------------
+# Remplace les boucles basic_consume(..., auto_ack=True) copiées
+# dans chaque service par un runtime commun :
+#   - acquittements manuels (un message en cours de traitement
+#     lors d’un redémarrage est redélivré au lieu d’être perdu)
+#   - basic_qos(prefetch_count) configurable
+#   - dispatch par lots : on collecte jusqu’à N messages ou on
+#     attend T millisecondes, puis on traite le lot et on
+#     l’acquitte en une fois (basic_ack(multiple=True))
+#   - reconnexion automatique avec backoff
+#   - file durable NOMMÉE par service (ex. "quota.events") : les
+#     répliques d’un même service se partagent les messages
+#     (competing consumers) au lieu de tous les recevoir
+#   - queue=None : file exclusive nommée par le broker, propre à la
+#     connexion — chaque processus reçoit alors TOUS les messages
+#     (diffusion, ex. réveil des clients en attente côté Booking)
+#   - échange topic : la file n’est liée qu’aux types d’événements
+#     (clés de routage) que le service traite ; chaque liaison "Type"
+#     devient "Type.#" pour accepter aussi les clés partitionnées
+#     "Type.pN" (voir common/partitioning.py)
+#
+# Deux signatures de handler :
+#   - handler(ch, method, properties, body)  → historique, un message
+#   - batch_handler(batch: list[Delivery])   → un lot, typiquement
+#     traité dans UNE transaction DB
+# Un handler qui lève Requeue (contre-pression, ex. dispatcher de
+# notifications plein) voit son message remis en file, même déjà
+# redélivré ; toute autre exception abandonne un message redélivré.
+#
+# Métriques par consommateur (common/metrics.py) : messages reçus et
+# en échec, durée des lots, retard (envoi → réception, en-tête
+# x-sent-ms), profondeur de la file (relue toutes les
+# CONSUMER_DEPTH_EVERY_S secondes) et allers-retours DB des lots.
+#
+# La connexion vient de common/transport.py : RabbitMQ, ou broker en
+# mémoire du processus (EVENT_TRANSPORT=memory) avec la même
+# sémantique de files, d’acquittements et de redélivrance.
+# ============================================================
+import os, time
+from collections import namedtuple
+from common import metrics, transport
+
+RABBIT_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+EXCHANGE = os.getenv("EVENTS_EXCHANGE", "events")
+
+PREFETCH = int(os.getenv("CONSUMER_PREFETCH", "100"))
+BATCH_SIZE = int(os.getenv("CONSUMER_BATCH_SIZE", "50"))
+BATCH_MS = int(os.getenv("CONSUMER_BATCH_MS", "50"))
+DEPTH_EVERY_S = float(os.getenv("CONSUMER_DEPTH_EVERY_S", "5"))
+
+# Un message reçu : method (delivery_tag, redelivered...), properties, body
+Delivery = namedtuple("Delivery", ["method", "properties", "body"])
+
+
+# Message à redélivrer plus tard (ressource saturée, pas message fautif)
+class Requeue(Exception):
+    pass
+
+
+class BatchConsumer:
+    def __init__(self, name: str, queue, routing_keys: list, handler=None, batch_handler=None,
+                 prefetch: int = PREFETCH, batch_size: int = BATCH_SIZE,
+                 batch_ms: int = BATCH_MS, host: str = RABBIT_HOST,
+                 queue_arguments: dict = None):
+        if (handler is None) == (batch_handler is None):
+            raise ValueError("exactly one of handler / batch_handler is required")
+        self.name = name
+        self.queue = queue
+        self.routing_keys = list(routing_keys)
+        self.handler = handler
+        self.batch_handler = batch_handler
+        self.batch_size = max(1, batch_size)
+        # le prefetch doit couvrir au moins un lot complet
+        self.prefetch = max(prefetch, self.batch_size)
+        self.batch_ms = max(1, batch_ms)
+        self.host = host
+        self.queue_arguments = queue_arguments
+
+        self.received = metrics.counter("consumer_messages_total", "Messages reçus", consumer=name)
+        self.failed = metrics.counter("consumer_failed_total", "Messages en échec (nack)", consumer=name)
+        self.batch_latency = metrics.histogram("consumer_batch_seconds", "Traitement d’un lot", consumer=name)
+        self.lag = metrics.histogram("consumer_lag_seconds", "Retard entre l’envoi et la réception d’un message",
+                                     buckets=metrics.LAG_BUCKETS, consumer=name)
+        self.depth = metrics.gauge("consumer_queue_depth", "Messages prêts dans la file", consumer=name)
+        # rapporté à consumer_messages_total : allers-retours DB par message
+        self.db_round_trips = metrics.counter("consumer_db_round_trips_total", "Requêtes SQL + commits des lots",
+                                              consumer=name)
+
+    # --------------------------------------------------------
+    # Déclaration de l’échange / de la file
+    # --------------------------------------------------------
+    def _setup(self, ch) -> str:
+        ch.exchange_declare(exchange=EXCHANGE, exchange_type="topic", durable=True)
+        if self.queue:
+            # file durable partagée par toutes les répliques du service
+            ch.queue_declare(queue=self.queue, durable=True, arguments=self.queue_arguments)
+            queue = self.queue
+        else:
+            # file exclusive de ce processus, supprimée à la déconnexion
+            res = ch.queue_declare(queue="", exclusive=True, arguments=self.queue_arguments)
+            queue = res.method.queue
+        for rk in self.routing_keys:
+            ch.queue_bind(exchange=EXCHANGE, queue=queue, routing_key=f"{rk}.#")
+        ch.basic_qos(prefetch_count=self.prefetch)
+        return queue
+
+    # --------------------------------------------------------
+    # Traitement d’un lot + acquittements
+    # --------------------------------------------------------
+    def _nack(self, ch, d: Delivery, e: Exception):
+        # un message déjà redélivré qui échoue encore est abandonné
+        # (sinon il bouclerait indéfiniment en tête de file)
+        requeue = isinstance(e, Requeue) or not d.method.redelivered
+        print(f"[{self.name}] message failed: {e!r} — {'requeued' if requeue else 'dropped'}", flush=True)
+        self.failed.inc()
+        ch.basic_nack(delivery_tag=d.method.delivery_tag, requeue=requeue)
+
+    def _process_messages(self, ch, batch):
+        # handler historique : un appel par message, un ack groupé si tout passe
+        failed = []
+        for d in batch:
+            try:
+                self.handler(ch, d.method, d.properties, d.body)
+            except Exception as e:
+                failed.append((d, e))
+        if not failed:
+            ch.basic_ack(delivery_tag=batch[-1].method.delivery_tag, multiple=True)
+            return
+        bad = {d.method.delivery_tag for d, _ in failed}
+        for d in batch:
+            if d.method.delivery_tag not in bad:
+                ch.basic_ack(delivery_tag=d.method.delivery_tag)
+        for d, e in failed:
+            self._nack(ch, d, e)
+
+    def _process_batch(self, ch, batch):
+        try:
+            self.batch_handler(batch)
+            ch.basic_ack(delivery_tag=batch[-1].method.delivery_tag, multiple=True)
+            return
+        except Exception as e:
+            print(f"[{self.name}] batch of {len(batch)} failed: {e!r} — retrying one by one", flush=True)
+        # le lot a été annulé (rollback) : on isole le message fautif
+        for d in batch:
+            try:
+                self.batch_handler([d])
+                ch.basic_ack(delivery_tag=d.method.delivery_tag)
+            except Exception as e:
+                self._nack(ch, d, e)
+
+    def _process(self, ch, batch):
+        with self.batch_latency.time(), metrics.round_trips() as trips:
+            if self.batch_handler is not None:
+                self._process_batch(ch, batch)
+            else:
+                self._process_messages(ch, batch)
+        self.db_round_trips.inc(trips[0])
+
+    def _received(self, properties):
+        self.received.inc()
+        sent_ms = (getattr(properties, "headers", None) or {}).get("x-sent-ms")
+        if sent_ms is not None:
+            self.lag.observe(max(0.0, time.time() - sent_ms / 1000))
+
+    # --------------------------------------------------------
+    # Boucle : N messages ou T millisecondes, selon le premier atteint
+    # --------------------------------------------------------
+    def _consume(self, ch, queue: str):
+        timeout = self.batch_ms / 1000
+        batch, deadline, depth_at = [], None, 0.0
+        for method, properties, body in ch.consume(queue, inactivity_timeout=timeout):
+            if time.monotonic() >= depth_at:
+                self.depth.set(ch.queue_declare(queue=queue, passive=True).method.message_count)
+                depth_at = time.monotonic() + DEPTH_EVERY_S
+            if method is not None:
+                self._received(properties)
+                batch.append(Delivery(method, properties, body))
+                if deadline is None:
+                    deadline = time.monotonic() + timeout
+            if batch and (len(batch) >= self.batch_size or method is None or time.monotonic() >= deadline):
+                self._process(ch, batch)
+                batch, deadline = [], None
+
+    def run(self):
+        attempt, conn = 0, None
+        while True:
+            try:
+                print(f"[{self.name}] connecting to {transport.EVENT_TRANSPORT} at {self.host}...", flush=True)
+                conn = transport.connect(self.host, heartbeat=60)
+                ch = conn.channel()
+                q = self._setup(ch)
+                print(f"[{self.name}] bound to '{EXCHANGE}' queue='{q}' keys={self.routing_keys} prefetch={self.prefetch} "
+                      f"batch={self.batch_size}/{self.batch_ms}ms. waiting for messages...", flush=True)
+                attempt = 0
+                self._consume(ch, q)
+            except Exception as e:
+                # connexion abandonnée : les messages non acquittés sont redélivrés
+                try:
+                    if conn is not None and conn.is_open:
+                        conn.close()
+                except Exception:
+                    pass
+                attempt += 1
+                wait = min(5 * attempt, 30)
+                print(f"[{self.name}] connection error: {e} — retrying in {wait}s", flush=True)
+                time.sleep(wait)
@@ -0,0 +1,100 @@
+# ============================================================
+# db.py — Moteurs SQLAlchemy (module partagé)
+# ------------------------------------------------------------
+# Un seul moteur (donc un seul pool) par base et par processus :
+# l’API, le consommateur, le relais de l’outbox et les balayeurs d’un
+# même processus appellent get_engine(url) et se partagent le pool
+# au lieu d’en ouvrir chacun un.
+#
+# Connexions max vers Postgres = répliques × processus ×
+# (DB_POOL_SIZE + DB_MAX_OVERFLOW) : à garder sous max_connections
+# (ou sous default_pool_size de PgBouncer). Un service dont des
+# threads tiennent chacun une session en continu ajoute leur nombre à
+# la taille du pool (get_engine(url, reserved=N), ex. Quota : une
+# connexion par partition, voir quota/models.py).
+#
+# Réglages (variables d’environnement) :
+#   DB_POOL          queue (défaut) | null (pas de pool côté client,
+#                    une connexion par checkout : derrière PgBouncer)
+#   DB_POOL_SIZE     connexions gardées ouvertes (défaut 5)
+#   DB_MAX_OVERFLOW  connexions en plus sous charge (défaut 5)
+#   DB_POOL_TIMEOUT  attente max d’une connexion libre en s (défaut 10)
+#   DB_POOL_RECYCLE  âge max d’une connexion en s (défaut 1800) ;
+#                    remplace le ping sur les connexions coupées par
+#                    un pare-feu ou un redémarrage de PgBouncer
+#   DB_PRE_PING      1 → SELECT 1 avant chaque checkout (un aller-
+#                    retour de plus) ; 0 (défaut) → la connexion morte
+#                    est détectée à l’usage et le pool est invalidé
+#   DB_PGBOUNCER     1 → PgBouncer en mode transaction : pas de
+#                    requêtes préparées côté serveur (asyncpg), pas
+#                    de ping (PgBouncer gère les connexions serveur)
+#
+# Chaque moteur est instrumenté : spans SQL (common/tracing.py) et
+# saturation du pool (common/metrics.py), étiquette pool=<nom>.
+# ============================================================
+import os, threading
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from common import metrics, tracing
+
+DB_POOL = os.getenv("DB_POOL", "queue")
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+PRE_PING = os.getenv("DB_PRE_PING", "0") == "1" and not PGBOUNCER
+
+_engines = {}
+_lock = threading.Lock()
+
+
+# Options du pool selon le pilote (SQLite : pool par défaut de
+# SQLAlchemy, les options de QueuePool n’y ont pas de sens)
+def engine_options(url: str, reserved: int = 0) -> dict:
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite":
+        return {}
+    options = {"pool_pre_ping": PRE_PING}
+    if DB_POOL == "null":
+        options["poolclass"] = NullPool
+    else:
+        options.update(pool_size=POOL_SIZE + reserved, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT,
+                       pool_recycle=POOL_RECYCLE, pool_use_lifo=True)
+    if PGBOUNCER and u.get_driver_name() == "asyncpg":
+        # requêtes préparées invalides d’une transaction à l’autre
+        options["connect_args"] = {"statement_cache_size": 0}
+    return options
+
+
+def pool_name(url: str) -> str:
+    database = make_url(url).database or "db"
+    return os.path.splitext(os.path.basename(database))[0]
+
+
+# reserved : connexions en plus de DB_POOL_SIZE pour des threads qui
+# tiennent chacun une session (consommateurs partitionnés)
+def get_engine(url: str, name: str = None, reserved: int = 0):
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = tracing.instrument_engine(create_engine(url, **engine_options(url, reserved)))
+            metrics.instrument_engine(engine, name or pool_name(url))
+            _engines[url] = engine
+        return engine
+
+
+def get_async_engine(url: str, name: str = None):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            target = make_url(url)
+            if PGBOUNCER and target.get_driver_name() == "asyncpg":
+                # cache de requêtes préparées de SQLAlchemy (paramètre d’URL du dialecte)
+                target = target.update_query_dict({"prepared_statement_cache_size": "0"})
+            engine = tracing.instrument_engine(create_async_engine(target, **engine_options(url)))
+            metrics.instrument_engine(engine, name or f"{pool_name(url)}-async")
+            _engines[url] = engine
+        return engine
@@ -0,0 +1,113 @@
+# ============================================================
+# dedup.py — Idempotence des consommateurs (module partagé)
+# ------------------------------------------------------------
+# RabbitMQ livre au moins une fois (redélivrance après un crash,
+# republication par l’outbox) : chaque consommateur doit ignorer
+# un messageId déjà traité.
+#
+#   claim(s, mid) : écrit le marqueur ProcessedMessage dans la
+#     transaction du lot (INSERT ... ON CONFLICT DO NOTHING sur
+#     l’index unique) et renvoie False si le message a déjà été
+#     traité — un seul aller-retour, pas de SELECT préalable ni de
+#     commit dédié ; le marqueur et le changement d’état sont
+#     validés (ou annulés) ensemble
+#   LRU en mémoire des derniers ids validés : une redélivrance
+#     récente est écartée sans toucher la base. L’index unique
+#     reste l’arbitre (autres répliques, redémarrages).
+#   start_pruner(engine) : supprime périodiquement les marqueurs
+#     plus vieux que DEDUP_RETENTION_H heures
+# ============================================================
+import os, time, threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel, Field, Session
+
+DEDUP_CACHE_SIZE = int(os.getenv("DEDUP_CACHE_SIZE", "100000"))
+DEDUP_RETENTION_H = float(os.getenv("DEDUP_RETENTION_H", "168"))  # 7 jours
+DEDUP_PRUNE_EVERY_S = float(os.getenv("DEDUP_PRUNE_EVERY_S", "3600"))
+
+
+class ProcessedMessage(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    message_id: str = Field(index=True, unique=True)
+    processed_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+
+
+def _insert_ignore(s: Session, values: dict) -> bool:
+    dialect = s.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(ProcessedMessage).values(**values).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(ProcessedMessage).values(**values).on_conflict_do_nothing()
+    else:
+        try:
+            with s.begin_nested():
+                s.exec(insert(ProcessedMessage).values(**values))
+            return True
+        except IntegrityError:
+            return False
+    return s.exec(stmt).rowcount == 1
+
+
+class Deduplicator:
+    def __init__(self, cache_size: int = DEDUP_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def _seen_recently(self, message_id: str) -> bool:
+        with self._lock:
+            if message_id in self._recent:
+                self._recent.move_to_end(message_id)
+                return True
+            return False
+
+    # True : premier traitement (marqueur écrit dans la session `s`,
+    # à valider avec le lot) ; False : doublon, à ignorer
+    def claim(self, s: Session, message_id: str) -> bool:
+        if self._seen_recently(message_id) or not _insert_ignore(
+                s, {"message_id": message_id, "processed_at": datetime.now(timezone.utc)}):
+            self.duplicates += 1
+            return False
+        s.info.setdefault("dedup_claimed", []).append(message_id)
+        return True
+
+    # À appeler après le commit du lot : les ids réclamés dans `s`
+    # entrent dans le LRU (jamais avant, un rollback les annulerait)
+    def remember(self, s: Session):
+        claimed = s.info.pop("dedup_claimed", ())
+        with self._lock:
+            for mid in claimed:
+                self._recent[mid] = None
+            while len(self._recent) > self.cache_size:
+                self._recent.popitem(last=False)
+
+
+def prune(engine, retention_h: float = DEDUP_RETENTION_H) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=retention_h)
+    with Session(engine) as s:
+        n = s.exec(delete(ProcessedMessage).where(ProcessedMessage.processed_at < cutoff)).rowcount
+        s.commit()
+    return n
+
+
+def _prune_loop(engine):
+    while True:
+        try:
+            n = prune(engine)
+            if n:
+                print(f"[dedup] pruned {n} processed-message markers", flush=True)
+        except Exception as e:
+            print(f"[dedup] prune failed: {e!r}", flush=True)
+        time.sleep(DEDUP_PRUNE_EVERY_S)
+
+
+def start_pruner(engine) -> threading.Thread:
+    t = threading.Thread(target=_prune_loop, args=(engine,), name="dedup-pruner", daemon=True)
+    t.start()
+    return t
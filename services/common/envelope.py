@@ -0,0 +1,105 @@
+# ============================================================
+# envelope.py — Enveloppe des événements (module partagé)
+# ------------------------------------------------------------
+# Corps : {"type", "payload", "messageId", "timestamp", "version"}
+# Propriétés AMQP (lisibles SANS décoder le corps) :
+#   type          → type de l’événement (peek_type)
+#   message_id    → clé d’idempotence
+#   timestamp     → secondes epoch
+#   content_type  → encodage du corps
+#   headers       → {"x-schema-version": n, "traceparent": ...,
+#                    "x-sent-ms": epoch ms de l’envoi}
+#                   (contexte de trace, voir common/tracing.py ;
+#                   x-sent-ms mesure le retard des consommateurs)
+#
+# Encodage du corps (EVENT_ENCODING, côté producteur) :
+#   json    → application/json (orjson si installé, sinon json)
+#   msgpack → application/msgpack
+#   object  → aucun encodage : le corps est le dict lui-même
+#             (transport en mémoire, défaut avec EVENT_TRANSPORT=memory)
+# Le consommateur choisit le décodeur d’après content_type : des
+# producteurs aux encodages différents peuvent coexister.
+# ============================================================
+import os, json, time, uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+import pika
+import msgpack
+from common import schemas, tracing
+from common.transport import EVENT_TRANSPORT
+
+try:
+    import orjson
+except ImportError:  # encodage json standard
+    orjson = None
+
+ENCODING = os.getenv("EVENT_ENCODING", "object" if EVENT_TRANSPORT == "memory" else "json")
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+OBJECT = "application/x-python-object"
+CONTENT_TYPES = {"json": JSON, "msgpack": MSGPACK, "object": OBJECT}
+
+Event = namedtuple("Event", ["type", "payload", "message_id", "timestamp", "version"])
+
+
+def _json_dumps(obj) -> bytes:
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode()
+
+
+def _json_loads(body):
+    return orjson.loads(body) if orjson else json.loads(body)
+
+
+# le même corps est remis à chaque file liée : copie du payload à la
+# lecture pour qu’un consommateur ne voie pas les écritures d’un autre
+def _object_loads(body):
+    return {**body, "payload": dict(body.get("payload") or {})} if isinstance(body, dict) else body
+
+
+_DUMPS = {JSON: _json_dumps, MSGPACK: msgpack.packb, OBJECT: lambda obj: obj}
+_LOADS = {JSON: _json_loads, MSGPACK: msgpack.unpackb, OBJECT: _object_loads}
+
+
+def encode(event_type: str, payload: dict, message_id=None, timestamp=None, encoding: str = ENCODING,
+           traceparent=None):
+    content_type = CONTENT_TYPES[encoding]
+    message_id = message_id or uuid.uuid4().hex
+    version = schemas.current_version(event_type)
+    body = _DUMPS[content_type]({
+        "type": event_type,
+        "payload": payload,
+        "messageId": message_id,
+        "timestamp": timestamp or datetime.now(timezone.utc).isoformat(),
+        "version": version,
+    })
+    headers = {"x-schema-version": version, "x-sent-ms": int(time.time() * 1000)}
+    traceparent = traceparent or tracing.traceparent()
+    if traceparent:
+        headers["traceparent"] = traceparent
+    props = pika.BasicProperties(content_type=content_type, delivery_mode=2, type=event_type,
+                                 message_id=message_id, timestamp=int(time.time()), headers=headers)
+    return body, props
+
+
+# Type de l’événement d’après les propriétés AMQP (None pour un
+# message d’avant l’enveloppe : il faut alors décoder le corps)
+def peek_type(properties):
+    return getattr(properties, "type", None) if properties is not None else None
+
+
+# Décode, monte à la version courante et valide ; SchemaError (ou
+# erreur de décodage) si le message est invalide
+def decode(body: bytes, properties=None) -> Event:
+    content_type = getattr(properties, "content_type", None) or JSON
+    loads = _LOADS.get(content_type)
+    if loads is None:
+        raise schemas.SchemaError(f"unsupported content type {content_type!r}")
+    raw = loads(body)
+    if not isinstance(raw, dict) or "type" not in raw:
+        raise schemas.SchemaError("not an event envelope")
+    event_type = raw["type"]
+    version = raw.get("version") or 1
+    payload = schemas.validate(event_type, schemas.upgrade(event_type, version, raw.get("payload", {})))
+    return Event(event_type, payload, raw.get("messageId"), raw.get("timestamp"),
+                 schemas.current_version(event_type))
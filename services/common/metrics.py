@@ -0,0 +1,336 @@
+# ============================================================
+# metrics.py — Compteurs et histogrammes en mémoire (module partagé)
+# ------------------------------------------------------------
+# Instrumentation minimale, sans dépendance : chaque métrique est
+# enregistrée dans REGISTRY sous son nom (et ses labels),
+# thread-safe, et expose snapshot() (JSON). Les histogrammes ont des
+# bornes fixes (en secondes par défaut) et des compteurs cumulés par
+# borne, à la manière de Prometheus.
+#
+# GET /metrics (instrument_app) rend tout le registre au format texte
+# Prometheus, avec en plus :
+#   - http_request_seconds{method,route}  latence par route
+#   - db_pool_*{pool}                     attente d’une connexion du
+#                                         pool, connexions prises,
+#                                         débordement, threads en
+#                                         attente, timeouts : saturation
+#                                         du pool (instrument_engine)
+#   - http_db_round_trips{method,route}   requêtes SQL + commits par
+#                                         requête HTTP (round_trips)
+# Les autres métriques sont posées là où le travail est fait
+# (publisher, consumer, tracing.consumed, balayeurs...).
+# Les processus sans API (workers) exposent le registre sur
+# METRICS_PORT s’il est défini (start_http_server).
+# ============================================================
+import os, time, threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 100 µs → 5 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+# 1 ms → 5 min (retard des consommateurs)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+# allers-retours DB par opération (nombres entiers)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+REGISTRY = {}
+_registry_lock = threading.Lock()
+
+
+# Clé du registre : nom{label="valeur",...} (labels triés)
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _register(metric):
+    with _registry_lock:
+        return REGISTRY.setdefault(metric.key, metric)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str = "", labels: dict = None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.key = _key(name, self.labels)
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n: int = 1):
+        with self._lock:
+            self.value += n
+
+    def snapshot(self) -> dict:
+        return {"value": self.value}
+
+
+# Valeur lue au moment de l’export (fn) ou posée avec set()
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str = "", fn=None, labels: dict = None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.key = _key(name, self.labels)
+        self.fn = fn
+        self._value = 0
+
+    def set(self, value: float):
+        self._value = value
+
+    @property
+    def value(self):
+        return self.fn() if self.fn is not None else self._value
+
+    def snapshot(self) -> dict:
+        return {"value": self.value}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str = "", buckets=LATENCY_BUCKETS, labels: dict = None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.key = _key(name, self.labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # dernière case : +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    # Quantile approché : borne supérieure du bucket qui le contient
+    def quantile(self, q: float):
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank, seen = q * total, 0
+        for le, n in zip(self.buckets + (float("inf"),), counts):
+            seen += n
+            if seen >= rank:
+                return le
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, total, s = list(self.counts), self.count, self.sum
+        cumulative, acc = {}, 0
+        for le, n in zip(self.buckets + (float("inf"),), counts):
+            acc += n
+            cumulative["+Inf" if le == float("inf") else str(le)] = acc
+        return {"count": total, "sum": s, "buckets": cumulative,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+
+# Une métrique par (nom, labels) : counter("x_total", route="/a") et
+# counter("x_total", route="/b") sont deux séries de la même famille
+def counter(name: str, help: str = "", **labels) -> Counter:
+    key = _key(name, labels)
+    return REGISTRY.get(key) or _register(Counter(name, help, labels))
+
+
+def histogram(name: str, help: str = "", buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+    key = _key(name, labels)
+    return REGISTRY.get(key) or _register(Histogram(name, help, buckets, labels))
+
+
+def gauge(name: str, help: str = "", fn=None, **labels) -> Gauge:
+    key = _key(name, labels)
+    return REGISTRY.get(key) or _register(Gauge(name, help, fn, labels))
+
+
+def snapshot() -> dict:
+    with _registry_lock:
+        metrics = list(REGISTRY.values())
+    return {m.key: m.snapshot() for m in metrics}
+
+
+# ------------------------------------------------------------
+# Format texte Prometheus (version 0.0.4)
+# ------------------------------------------------------------
+def _num(v) -> str:
+    if v is None:
+        return "NaN"
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _series(name: str, labels: dict, extra: dict = None) -> str:
+    return _key(name, {**labels, **(extra or {})})
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = sorted(REGISTRY.values(), key=lambda m: m.key)
+    lines, described = [], set()
+    for m in metrics:
+        if m.name not in described:
+            described.add(m.name)
+            if m.help:
+                lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+        try:
+            if m.kind == "histogram":
+                snap = m.snapshot()
+                for le, n in snap["buckets"].items():
+                    lines.append(f"{_series(m.name + '_bucket', m.labels, {'le': le})} {n}")
+                lines.append(f"{_series(m.name + '_sum', m.labels)} {_num(snap['sum'])}")
+                lines.append(f"{_series(m.name + '_count', m.labels)} {snap['count']}")
+            else:
+                lines.append(f"{m.key} {_num(m.value)}")
+        except Exception as e:
+            # jauge dont la source a disparu (ex. pool recréé) : ignorée
+            lines.append(f"# {m.key} unavailable: {e!r}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------------------------------------
+# Instrumentation
+# ------------------------------------------------------------
+# Pool SQLAlchemy : attente pour obtenir une connexion (histogramme)
+# et connexions prises / taille du pool (jauges lues à l’export)
+# ------------------------------------------------------------
+# Allers-retours DB d’une opération
+# ------------------------------------------------------------
+# Chaque requête SQL et chaque COMMIT sur un moteur instrumenté
+# incrémente le compteur de l’opération en cours (requête HTTP, lot
+# consommé...) ouvert par round_trips().
+_round_trips = ContextVar("db_round_trips", default=None)
+
+
+@contextmanager
+def round_trips():
+    counter = [0]
+    token = _round_trips.set(counter)
+    try:
+        yield counter
+    finally:
+        _round_trips.reset(token)
+
+
+def _count_round_trip(*args):
+    counter = _round_trips.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def instrument_engine(engine, pool: str):
+    from sqlalchemy import event
+    target = getattr(engine, "sync_engine", engine)   # AsyncEngine
+    event.listen(target, "before_cursor_execute", _count_round_trip)
+    event.listen(target, "commit", _count_round_trip)
+    p = target.pool
+    wait = histogram("db_pool_checkout_seconds", "Attente d’une connexion du pool SQLAlchemy", pool=pool)
+    timeouts = counter("db_pool_timeouts_total", "Checkouts abandonnés après DB_POOL_TIMEOUT", pool=pool)
+    waiting, lock = [0], threading.Lock()
+    do_get = p._do_get
+
+    def timed_do_get():
+        t0 = time.perf_counter()
+        with lock:
+            waiting[0] += 1
+        try:
+            return do_get()
+        except Exception as e:
+            if type(e).__name__ == "TimeoutError":
+                timeouts.inc()
+            raise
+        finally:
+            with lock:
+                waiting[0] -= 1
+            wait.observe(time.perf_counter() - t0)
+
+    p._do_get = timed_do_get
+    gauge("db_pool_waiting", "Threads en attente d’une connexion", fn=lambda: waiting[0], pool=pool)
+    for attr, help in (("checkedout", "Connexions du pool en cours d’utilisation"),
+                       ("size", "Taille du pool SQLAlchemy")):
+        if hasattr(p, attr):
+            gauge(f"db_pool_{attr}", help, fn=lambda attr=attr: getattr(p, attr)(), pool=pool)
+    if hasattr(p, "overflow"):
+        # overflow() est négatif tant que le pool n’est pas rempli
+        gauge("db_pool_overflow", "Connexions ouvertes au-delà de la taille du pool",
+              fn=lambda: max(0, p.overflow()), pool=pool)
+        gauge("db_pool_capacity", "Connexions max (taille + débordement)",
+              fn=lambda: p.size() + max(0, p._max_overflow), pool=pool)
+    return engine
+
+
+# Latence par route + GET /metrics
+def instrument_app(app):
+    from fastapi import Request
+    from fastapi.responses import PlainTextResponse
+
+    @app.middleware("http")
+    async def _time_request(request: Request, call_next):
+        t0 = time.perf_counter()
+        with round_trips() as trips:
+            response = await call_next(request)
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        histogram("http_request_seconds", "Latence des requêtes HTTP par route",
+                  method=request.method, route=path).observe(time.perf_counter() - t0)
+        histogram("http_db_round_trips", "Requêtes SQL + commits par requête HTTP", buckets=COUNT_BUCKETS,
+                  method=request.method, route=path).observe(trips[0])
+        counter("http_requests_total", "Requêtes HTTP par route et statut",
+                method=request.method, route=path, status=response.status_code).inc()
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+    return app
+
+
+# Processus sans API (workers) : registre servi sur METRICS_PORT
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port: int = METRICS_PORT):
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[metrics] serving on :{port}", flush=True)
+    return server
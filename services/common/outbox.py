@@ -0,0 +1,177 @@
+# ============================================================
+# outbox.py — Outbox transactionnelle + relais vers RabbitMQ
+#             (module partagé)
+# ------------------------------------------------------------
+# Les routes et les consommateurs ne publient plus directement : ils
+# écrivent l’événement dans la table Outbox, DANS LA MÊME
+# TRANSACTION que leur changement d’état (enqueue / enqueue_many,
+# sans commit). Le broker n’est plus sur le chemin de la requête et
+# un événement ne peut plus être perdu après le commit — en
+# particulier un message marqué traité (common/dedup.py) a forcément
+# ses événements résultants en base.
+#
+# Utilisé par Booking (réservations), Access (AccessCodeIssued /
+# AccessIssueFailed) et Quota (QuotaReserved / QuotaDenied), chacun
+# dans sa base.
+#
+# Le relais (thread de fond, start_relay(engine), un par base) :
+#   1. lit jusqu’à OUTBOX_BATCH lignes par ordre d’id
+#      (FOR UPDATE SKIP LOCKED sur Postgres : plusieurs relais
+#      — API + workers — se partagent les lignes sans doublon)
+#   2. les publie en un lot confirmé par le broker
+#   3. supprime les lignes et valide
+# En cas d’échec entre 2 et 3, les lignes sont republiées avec le
+# même messageId : livraison au moins une fois.
+#
+# Réglages : OUTBOX_BATCH fixe la taille d’un lot, donc d’une
+# transaction AMQP (tx_select / tx_commit) ; le relais n’accumule
+# rien d’autre. De l’EventPublisher (common/publisher.py) il ne
+# retient que RABBITMQ_HOST, EVENTS_EXCHANGE et PUBLISH_CONFIRM.
+#
+# Réveil : kick() après un commit du processus (réveille tous les
+# relais du processus, un par service dans services/monolith.py) ;
+# sinon sondage toutes les OUTBOX_POLL_MS millisecondes (lignes
+# écrites par un autre processus).
+#
+# Traces : la ligne garde le traceparent de l’écrivain (requête HTTP
+# ou message consommé) ; le relais publie chaque ligne dans un span
+# "publish <type>" enfant de ce contexte (voir common/tracing.py).
+# ============================================================
+import os, json, uuid, threading
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import delete
+from sqlmodel import SQLModel, Field, Session, select
+from common.publisher import EventPublisher
+from common import tracing
+
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "200"))
+OUTBOX_POLL_MS = int(os.getenv("OUTBOX_POLL_MS", "200"))
+
+
+# ------------------------------------------------------------
+# Outbox
+# ------------------------------------------------------------
+# Une ligne par événement à publier. message_id est fixé à
+# l’écriture : il reste le même si le relais republie la ligne
+# (livraison au moins une fois, dédoublonnage côté consommateur).
+# La ligne est supprimée une fois l’envoi confirmé par le broker.
+# ------------------------------------------------------------
+class Outbox(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    message_id: str = Field(unique=True)
+    event_type: str
+    payload: str  # JSON
+    partition_key: Optional[str] = None
+    traceparent: Optional[str] = None  # contexte de trace de l’écrivain (common/tracing.py)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+# ------------------------------------------------------------
+# Écriture (dans la transaction de l’appelant)
+# ------------------------------------------------------------
+def enqueue(s, event_type: str, payload: dict, partition_key=None):
+    s.add(Outbox(message_id=uuid.uuid4().hex, event_type=event_type, payload=json.dumps(payload),
+                 partition_key=None if partition_key is None else str(partition_key),
+                 traceparent=tracing.traceparent()))
+
+
+# events : liste de (event_type, payload[, partition_key])
+def enqueue_many(s, events):
+    for e in events:
+        enqueue(s, *e)
+
+
+# ------------------------------------------------------------
+# Relais
+# ------------------------------------------------------------
+_relays = []
+
+
+# Signale aux relais du processus qu’il y a des lignes à publier
+def kick():
+    for relay in list(_relays):
+        relay.wakeup.set()
+
+
+# Publie un lot ; renvoie le nombre de lignes relayées
+def relay_once(engine, publisher: EventPublisher, batch_size: int = OUTBOX_BATCH) -> int:
+    with Session(engine) as s:
+        q = select(Outbox).order_by(Outbox.id).limit(batch_size)
+        if engine.dialect.name == "postgresql":
+            q = q.with_for_update(skip_locked=True)
+        rows = s.exec(q).all()
+        if not rows:
+            return 0
+        spans = [tracing.start_span(f"publish {r.event_type}", parent=r.traceparent, kind="producer",
+                                    messageId=r.message_id) for r in rows]
+        publisher.send_confirmed([(r.event_type, json.loads(r.payload), r.partition_key, r.message_id,
+                                   _iso_utc(r.created_at), sp.traceparent) for r, sp in zip(rows, spans)])
+        s.exec(delete(Outbox).where(Outbox.id.in_([r.id for r in rows])))
+        s.commit()
+    for r, sp in zip(rows, spans):
+        tracing.finish(sp)
+        print(f"[event] {r.event_type} {r.payload}", flush=True)
+    return len(rows)
+
+
+# created_at relu en base (UTC naïf) → horodatage de l’enveloppe
+def _iso_utc(dt: datetime) -> str:
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).isoformat()
+
+
+class Relay:
+    def __init__(self, engine):
+        self.engine = engine
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def run(self):
+        # publisher dédié : lots en transaction AMQP (un aller-retour
+        # confirmé par lot)
+        publisher = EventPublisher()
+        print(f"[outbox] relay started batch={OUTBOX_BATCH} poll={OUTBOX_POLL_MS}ms", flush=True)
+        attempt = 0
+        while not self.stopped.is_set():
+            # effacé AVANT la lecture : un kick() pendant le lot n’est pas perdu
+            self.wakeup.clear()
+            try:
+                n = relay_once(self.engine, publisher)
+                attempt = 0
+            except Exception as e:
+                attempt += 1
+                wait = min(attempt, 30)
+                print(f"[outbox] relay error: {e!r} — retrying in {wait}s", flush=True)
+                self.stopped.wait(wait)
+                continue
+            if n < OUTBOX_BATCH:
+                # file vidée : on dort jusqu’au prochain kick() ou sondage
+                publisher.keepalive()
+                self.wakeup.wait(OUTBOX_POLL_MS / 1000)
+        publisher.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="outbox-relay", daemon=True)
+        self.thread.start()
+        return self
+
+    # Arrêt propre : termine le lot en cours puis ferme la connexion
+    def stop(self, timeout: float = 5):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+def start_relay(engine) -> Relay:
+    relay = Relay(engine).start()
+    _relays.append(relay)
+    return relay
+
+
+# Arrête tous les relais du processus (les lignes restantes seront
+# publiées au prochain démarrage)
+def stop_relay(timeout: float = 5):
+    while _relays:
+        _relays.pop().stop(timeout)
@@ -0,0 +1,33 @@
+# ============================================================
+# partitioning.py — Partitionnement des événements par clé
+# ------------------------------------------------------------
+# Certains traitements ne sont corrects que si les événements d’une
+# même clé sont traités dans l’ordre, un à la fois (ex. Quota :
+# lecture du cumul de la semaine puis insertion, par userId).
+#
+# Le producteur suffixe la clé de routage par la partition de la
+# clé : "BookingCreated" → "BookingCreated.p3". Le consommateur
+# partitionné déclare une file par partition ("quota.events.p3"),
+# avec x-single-active-consumer : une seule réplique à la fois
+# consomme une partition donnée, les autres restent en secours.
+# Les consommateurs non partitionnés lient "BookingCreated.#" et
+# reçoivent toutes les partitions.
+#
+# Le hachage (crc32) est stable entre processus, contrairement à
+# hash() qui est randomisé par interpréteur.
+# ============================================================
+import os, zlib
+
+# Doit être identique chez le producteur et le consommateur
+PARTITIONS = int(os.getenv("EVENT_PARTITIONS", "8"))
+
+# Arguments de file pour une partition : un seul consommateur actif
+SINGLE_ACTIVE_CONSUMER = {"x-single-active-consumer": True}
+
+
+def partition_for(key, partitions: int = PARTITIONS) -> int:
+    return zlib.crc32(str(key).encode()) % partitions
+
+
+def partitioned_key(event_type: str, partition: int) -> str:
+    return f"{event_type}.p{partition}"
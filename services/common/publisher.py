@@ -0,0 +1,145 @@
+# ============================================================
+# publisher.py — Émission d'événements RabbitMQ (module partagé)
+# ------------------------------------------------------------
+# Ce module gère l’envoi des événements inter-services au broker.
+# Les services ne l’appellent plus directement : ils écrivent leurs
+# événements dans leur Outbox (common/outbox.py) et le relais de
+# chaque base les envoie par lots avec un EventPublisher :
+#   - UNE connexion et UN canal persistants par relais
+#   - un lot = un aller-retour confirmé (tx_select / tx_commit)
+#   - reconnexion automatique si le broker coupe la connexion
+#   - heartbeats entretenus pendant les périodes sans événement
+#
+# L’échange "events" est de type topic : la clé de routage est le
+# type de l’événement (ex. "BookingCreated"), chaque service ne lie
+# sa file qu’aux types qu’il traite (voir common/consumer.py).
+# Les messages sont persistants (delivery_mode=2) pour survivre à un
+# redémarrage du broker dans les files durables. Enveloppe, encodage
+# et versions de schéma : common/envelope.py et common/schemas.py.
+# Transport (RabbitMQ ou broker en mémoire, EVENT_TRANSPORT) :
+# common/transport.py.
+# ============================================================
+import os, threading
+from pika.exceptions import AMQPError
+from common import envelope, metrics, transport
+from common.partitioning import partition_for, partitioned_key
+
+RABBIT_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+EXCHANGE = os.getenv("EVENTS_EXCHANGE", "events")
+# PUBLISH_CONFIRM=0 → lots envoyés sans attendre l’ack du broker
+CONFIRM = os.getenv("PUBLISH_CONFIRM", "1") == "1"
+
+# Latence d’un envoi (un lot, confirmation comprise)
+PUBLISH_LATENCY = metrics.histogram("events_publish_seconds", "Envoi d’un lot au broker, confirmation comprise")
+
+
+# ------------------------------------------------------------
+# EventPublisher
+# ------------------------------------------------------------
+# Une instance par relais (common/outbox.py). Toutes les opérations
+# sur le canal pika passent par self._lock car une BlockingConnection
+# ne doit être utilisée que par un thread à la fois.
+#
+# Confirmations : le canal pika bloquant attend les confirms un par
+# un, on utilise donc tx_select/tx_commit → un seul aller-retour (et
+# un seul ack broker) pour tout le lot.
+# ------------------------------------------------------------
+class EventPublisher:
+    def __init__(self, host: str = RABBIT_HOST, exchange: str = EXCHANGE,
+                 confirm: bool = CONFIRM, heartbeat: int = 60):
+        self.host = host
+        self.exchange = exchange
+        self.confirm = confirm
+        self.heartbeat = heartbeat
+
+        self._lock = threading.RLock()
+        self._conn = None
+        self._ch = None
+
+    # --------------------------------------------------------
+    # Connexion (paresseuse) au broker
+    # --------------------------------------------------------
+    def _connect(self):
+        self._disconnect()
+        self._conn = transport.connect(self.host, self.heartbeat)
+        self._ch = self._conn.channel()
+        # Déclare ou crée l’échange topic s’il n’existe pas déjà
+        # durable=True pour survivre aux redémarrages RabbitMQ
+        self._ch.exchange_declare(exchange=self.exchange, exchange_type="topic", durable=True)
+        if self.confirm:
+            self._ch.tx_select()
+        print(f"[publisher] connected to {transport.EVENT_TRANSPORT} at {self.host}", flush=True)
+
+    def _disconnect(self):
+        try:
+            if self._conn is not None and self._conn.is_open:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+        self._ch = None
+
+    def _channel(self):
+        if self._ch is None or self._ch.is_closed or self._conn.is_closed:
+            self._connect()
+        return self._ch
+
+    # Connexion inactive (relais sans événement à publier) : traite les
+    # heartbeats du broker, sinon il coupe la connexion au bout de
+    # 2 × heartbeat secondes
+    def keepalive(self):
+        with self._lock:
+            try:
+                if self._conn is not None and self._conn.is_open:
+                    self._conn.process_data_events(0)
+            except Exception:
+                self._disconnect()
+
+    # --------------------------------------------------------
+    # Envoi
+    # --------------------------------------------------------
+    def _send(self, batch):
+        ch = self._channel()
+        with PUBLISH_LATENCY.time():
+            for routing_key, body, props in batch:
+                ch.basic_publish(exchange=self.exchange, routing_key=routing_key, body=body, properties=props)
+            if self.confirm:
+                ch.tx_commit()
+        for _, _, props in batch:
+            metrics.counter("events_published_total", "Événements publiés par type", type=props.type).inc()
+
+    # Enveloppe versionnée (common/envelope.py) ; messageId unique par
+    # événement (fourni par l’outbox pour rester stable entre deux
+    # envois) : clé d’idempotence des consommateurs.
+    @staticmethod
+    def _encode(event_type: str, payload: dict, partition_key=None, message_id=None, timestamp=None,
+                traceparent=None):
+        body, props = envelope.encode(event_type, payload, message_id, timestamp, traceparent=traceparent)
+        routing_key = event_type
+        if partition_key is not None:
+            routing_key = partitioned_key(event_type, partition_for(partition_key))
+        return routing_key, body, props
+
+    # Envoi synchrone d’un lot : rend la main une fois le lot confirmé
+    # par le broker (tx_commit), lève sinon ; une reconnexion en cas de
+    # connexion perdue (heartbeat, redémarrage broker...).
+    # events : liste de (event_type, payload, partition_key, message_id, timestamp, traceparent)
+    def send_confirmed(self, events):
+        if not events:
+            return
+        encoded = [self._encode(*e) for e in events]
+        with self._lock:
+            try:
+                self._send(encoded)
+            except AMQPError as e:
+                print(f"[publisher] publish failed: {e!r} — reconnecting", flush=True)
+                self._disconnect()
+                try:
+                    self._send(encoded)
+                except Exception:
+                    self._disconnect()
+                    raise
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
@@ -0,0 +1,71 @@
+# ============================================================
+# schemas.py — Registre des schémas d’événements (module partagé)
+# ------------------------------------------------------------
+# Pour chaque type d’événement : version courante et champs
+# obligatoires du payload (avec leur type). Le publisher estampille
+# la version courante ; à la réception, upgrade() fait monter un
+# payload d’une ancienne version jusqu’à la version courante (chaîne
+# UPGRADES) puis validate() vérifie les champs.
+#
+# Faire évoluer un événement :
+#   1. incrémenter `version` et mettre à jour `fields`
+#   2. ajouter UPGRADES[(type, ancienne_version)] = fonction(payload)
+#      qui renvoie le payload à la version suivante
+# Les messages sans version (avant l’enveloppe versionnée) sont en v1.
+#
+# Un champ facultatif (ex. "userId" des événements de cycle de vie,
+# lu par Notification) s’ajoute sans changer de version : seuls les
+# champs listés ici sont exigés.
+# ============================================================
+
+class SchemaError(ValueError):
+    pass
+
+
+SCHEMAS = {
+    "BookingCreated":    {"version": 1, "fields": {"bookingId": int, "userId": int, "studioId": int, "start": str, "end": str}},
+    "BookingReady":      {"version": 1, "fields": {"bookingId": int}},
+    "BookingCancelled":  {"version": 1, "fields": {"bookingId": int, "reason": str}},
+    "BookingCheckedIn":  {"version": 1, "fields": {"bookingId": int}},
+    "BookingCheckedOut": {"version": 1, "fields": {"bookingId": int}},
+    "AccessCodeIssued":  {"version": 1, "fields": {"bookingId": int, "code": str}},
+    "AccessIssueFailed": {"version": 1, "fields": {"bookingId": int, "reason": str}},
+    "QuotaReserved":     {"version": 1, "fields": {"bookingId": int, "reservationId": str}},
+    "QuotaDenied":       {"version": 1, "fields": {"bookingId": int, "reason": str}},
+}
+
+# (type, version) → fonction payload vN → payload vN+1
+UPGRADES = {}
+
+
+def current_version(event_type: str) -> int:
+    schema = SCHEMAS.get(event_type)
+    return schema["version"] if schema else 1
+
+
+def upgrade(event_type: str, version: int, payload: dict) -> dict:
+    target = current_version(event_type)
+    if version > target:
+        raise SchemaError(f"{event_type} v{version} is newer than supported v{target}")
+    while version < target:
+        step = UPGRADES.get((event_type, version))
+        if step is None:
+            raise SchemaError(f"no upgrade path for {event_type} v{version}")
+        payload = step(payload)
+        version += 1
+    return payload
+
+
+def validate(event_type: str, payload: dict) -> dict:
+    schema = SCHEMAS.get(event_type)
+    if schema is None:
+        # type inconnu du registre : transmis tel quel
+        return payload
+    if not isinstance(payload, dict):
+        raise SchemaError(f"{event_type}: payload must be an object")
+    for name, kind in schema["fields"].items():
+        if name not in payload:
+            raise SchemaError(f"{event_type}: missing field {name!r}")
+        if not isinstance(payload[name], kind) or (kind is int and isinstance(payload[name], bool)):
+            raise SchemaError(f"{event_type}: field {name!r} must be {kind.__name__}")
+    return payload
@@ -0,0 +1,87 @@
+# ============================================================
+# sweeper.py — Tâches de nettoyage périodiques (module partagé)
+# ------------------------------------------------------------
+# Les tables d’état (AccessCode, QuotaReservation) grossissent sans
+# fin. Chaque service lance un balayeur qui, toutes les
+# SWEEP_INTERVAL_S secondes :
+#   - fait passer à l’état terminal les lignes expirées
+#   - déplace les vieilles lignes terminées vers une table
+#     d’archive de même schéma (archive_rows)
+# Tout se fait par lots de SWEEP_BATCH lignes, un commit par lot,
+# au plus SWEEP_MAX_BATCHES lots par tâche et par passage : une
+# passe ne verrouille jamais beaucoup de lignes ni longtemps.
+# Lignes traitées et durée des passages : common/metrics.py.
+# ============================================================
+import os, time, threading
+from sqlalchemy import delete, insert
+from sqlmodel import Session, select
+from common import metrics
+
+SWEEP_INTERVAL_S = float(os.getenv("SWEEP_INTERVAL_S", "300"))
+SWEEP_BATCH = int(os.getenv("SWEEP_BATCH", "500"))
+SWEEP_MAX_BATCHES = int(os.getenv("SWEEP_MAX_BATCHES", "20"))
+
+
+# Répète `step(batch_size)` (qui renvoie le nombre de lignes traitées)
+# tant que les lots sont pleins, dans la limite de SWEEP_MAX_BATCHES
+def in_batches(step, batch_size: int = SWEEP_BATCH, max_batches: int = SWEEP_MAX_BATCHES) -> int:
+    total = 0
+    for _ in range(max_batches):
+        n = step(batch_size)
+        total += n
+        if n < batch_size:
+            break
+    return total
+
+
+# Un lot : copie dans `archive` puis supprime de `model` les lignes
+# qui vérifient `condition` (même transaction)
+def archive_rows(engine, model, archive, key, condition, batch_size: int) -> int:
+    with Session(engine) as s:
+        q = select(key).where(condition).order_by(key).limit(batch_size)
+        if engine.dialect.name == "postgresql":
+            # plusieurs répliques peuvent balayer en même temps
+            q = q.with_for_update(skip_locked=True)
+        ids = s.exec(q).all()
+        if not ids:
+            return 0
+        cols = [c.name for c in model.__table__.columns]
+        s.exec(insert(archive).from_select(cols, select(*[model.__table__.c[c] for c in cols]).where(key.in_(ids))))
+        s.exec(delete(model).where(key.in_(ids)))
+        s.commit()
+    return len(ids)
+
+
+class Sweeper:
+    # tasks : {nom: fonction() → lignes traitées}
+    def __init__(self, service: str, tasks: dict, interval: float = SWEEP_INTERVAL_S):
+        self.service = service
+        self.tasks = tasks
+        self.interval = interval
+        self.duration = metrics.histogram(f"{service}_sweep_seconds", f"Durée d’un passage du balayeur {service}")
+        self.rows = {name: metrics.counter(f"{service}_sweep_{name}_total", f"Lignes traitées par la tâche {name}")
+                     for name in tasks}
+
+    def run_once(self) -> dict:
+        done = {}
+        with self.duration.time():
+            for name, task in self.tasks.items():
+                try:
+                    done[name] = task()
+                except Exception as e:
+                    print(f"[{self.service}-sweeper] {name} failed: {e!r}", flush=True)
+                    continue
+                self.rows[name].inc(done[name])
+        if any(done.values()):
+            print(f"[{self.service}-sweeper] {done}", flush=True)
+        return done
+
+    def run(self):
+        while True:
+            self.run_once()
+            time.sleep(self.interval)
+
+    def start(self) -> threading.Thread:
+        t = threading.Thread(target=self.run, name=f"{self.service}-sweeper", daemon=True)
+        t.start()
+        return t
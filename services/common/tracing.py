@@ -0,0 +1,318 @@
+# ============================================================
+# tracing.py — Traces distribuées de la saga (module partagé)
+# ------------------------------------------------------------
+# Contexte de trace au format W3C : traceparent
+#   "00-<trace_id 32 hex>-<span_id 16 hex>-01"
+# propagé :
+#   - dans les requêtes HTTP (en-tête traceparent, voir inject() et
+#     instrument_app())
+#   - dans les événements (en-tête AMQP traceparent, posé par
+#     common/envelope.py ; l’outbox de Booking le garde en base)
+#
+# Spans :
+#   - span(name)            → bloc de code (devient le span courant)
+#   - instrument_app(app)   → une requête HTTP entrante
+#   - consumed(properties)  → traitement d’un message reçu
+#   - instrument_engine(e)  → chaque requête SQL exécutée DANS un
+#                             span (les autres ne sont pas tracées)
+#
+# Exportateurs (TRACE_EXPORTERS, séparés par des virgules) :
+#   memory  → tampon circulaire en mémoire (TRACE_BUFFER spans),
+#             servi par GET /debug/traces/{traceId}  (défaut)
+#   file    → une ligne JSON par span dans TRACE_FILE
+#   none    → aucun export
+#   paquet.module:Classe → exportateur fourni par l’application
+# Un exportateur a une méthode export(span: dict) et, s’il sait les
+# relire, spans(trace_id) et find(key, value).
+# ============================================================
+import os, json, time, secrets, threading, importlib
+from common import metrics
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import APIRouter, Request
+
+SERVICE = os.getenv("SERVICE_NAME", "app")
+TRACE_EXPORTERS = os.getenv("TRACE_EXPORTERS", "memory")
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "20000"))
+TRACE_FILE = os.getenv("TRACE_FILE", "/tmp/traces.jsonl")
+# requêtes HTTP non tracées (préfixes de chemin)
+UNTRACED_PATHS = ("/debug/", "/metrics", "/health")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+
+
+# ------------------------------------------------------------
+# Span
+# ------------------------------------------------------------
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "attrs", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str, attrs: dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.attrs = attrs
+        self.error = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self, end: float) -> dict:
+        return {"traceId": self.trace_id, "spanId": self.span_id, "parentId": self.parent_id,
+                "name": self.name, "kind": self.kind, "service": SERVICE, "start": self.start,
+                "durationMs": round((end - self.start) * 1000, 3), "attrs": self.attrs, "error": self.error}
+
+
+def parse(traceparent: Optional[str]):
+    # → (trace_id, span_id), ou None si absent / mal formé
+    if not traceparent:
+        return None
+    parts = traceparent.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+# parent : traceparent (str), Span, ou None → span courant, sinon
+# début d’une nouvelle trace
+def start_span(name: str, parent=None, kind: str = "internal", **attrs) -> Span:
+    if parent is None:
+        parent = _current.get()
+    if isinstance(parent, Span):
+        return Span(name, parent.trace_id, parent.span_id, kind, attrs)
+    ctx = parse(parent)
+    if ctx is None:
+        return Span(name, secrets.token_hex(16), None, kind, attrs)
+    return Span(name, ctx[0], ctx[1], kind, attrs)
+
+
+def finish(sp: Span):
+    data = sp.to_dict(time.time())
+    for exporter in exporters:
+        try:
+            exporter.export(data)
+        except Exception as e:
+            print(f"[tracing] export failed: {e!r}", flush=True)
+
+
+@contextmanager
+def span(name: str, parent=None, kind: str = "internal", **attrs):
+    sp = start_span(name, parent, kind, **attrs)
+    token = _current.set(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        finish(sp)
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+def traceparent() -> Optional[str]:
+    sp = _current.get()
+    return sp.traceparent if sp is not None else None
+
+
+# Attributs sur le span courant (ex. bookingId, pour retrouver la trace)
+def tag(**attrs):
+    sp = _current.get()
+    if sp is not None:
+        sp.set(**attrs)
+
+
+# Ajoute `value` à l’attribut liste `key` du span courant (ex. les
+# bookingId créés par une requête en masse)
+def tag_append(key: str, value):
+    sp = _current.get()
+    if sp is not None:
+        values = sp.attrs.setdefault(key, [])
+        if value not in values:
+            values.append(value)
+
+
+# En-têtes HTTP sortants : headers=tracing.inject()
+def inject(headers: Optional[dict] = None) -> dict:
+    headers = dict(headers or {})
+    tp = traceparent()
+    if tp:
+        headers["traceparent"] = tp
+    return headers
+
+
+# Traitement d’un message reçu : span enfant du span de publication
+# (en-tête AMQP traceparent), nouvelle trace sinon ; durée aussi
+# mesurée par type d’événement (consumer_handle_seconds)
+@contextmanager
+def consumed(properties):
+    headers = getattr(properties, "headers", None) or {}
+    event_type = getattr(properties, "type", None) or "message"
+    duration = metrics.histogram("consumer_handle_seconds", "Traitement d’un message par type d’événement",
+                                 type=event_type)
+    with duration.time(), span(f"handle {event_type}", parent=headers.get("traceparent"), kind="consumer") as sp:
+        yield sp
+
+
+# ------------------------------------------------------------
+# Instrumentation
+# ------------------------------------------------------------
+def instrument_engine(engine):
+    from sqlalchemy import event   # pas de SQLAlchemy dans Notification
+    target = getattr(engine, "sync_engine", engine)   # AsyncEngine
+
+    @event.listens_for(target, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+            context._trace_span = start_span(f"db {verb}", kind="client", statement=statement[:200])
+
+    @event.listens_for(target, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        sp = getattr(context, "_trace_span", None)
+        if sp is not None:
+            context._trace_span = None
+            finish(sp)
+
+    @event.listens_for(target, "handle_error")
+    def _error(exception_context):
+        context = exception_context.execution_context
+        sp = getattr(context, "_trace_span", None) if context is not None else None
+        if sp is not None:
+            context._trace_span = None
+            sp.error = repr(exception_context.original_exception)
+            finish(sp)
+
+    return engine
+
+
+# Span par requête HTTP entrante + route GET /debug/traces/{traceId}
+def instrument_app(app):
+    @app.middleware("http")
+    async def _trace_request(request: Request, call_next):
+        if request.url.path.startswith(UNTRACED_PATHS):
+            return await call_next(request)
+        with span(f"{request.method} {request.url.path}", parent=request.headers.get("traceparent"),
+                  kind="server") as sp:
+            response = await call_next(request)
+            route = request.scope.get("route")
+            if route is not None:
+                sp.name = f"{request.method} {route.path}"
+            sp.set(status=response.status_code)
+            return response
+
+    app.include_router(router)
+    return app
+
+
+router = APIRouter()
+
+
+@router.get("/debug/traces/{trace_id}")
+def get_trace(trace_id: str):
+    return {"service": SERVICE, "spans": spans(trace_id)}
+
+
+# ------------------------------------------------------------
+# Exportateurs
+# ------------------------------------------------------------
+class MemoryExporter:
+    def __init__(self, size: int = TRACE_BUFFER):
+        self._spans = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def export(self, data: dict):
+        with self._lock:
+            self._spans.append(data)
+
+    def spans(self, trace_id: str) -> list:
+        with self._lock:
+            return [d for d in self._spans if d["traceId"] == trace_id]
+
+    # traces dont un span porte l’attribut key == value (ou le contient)
+    def find(self, key: str, value) -> list:
+        with self._lock:
+            found = []
+            for d in self._spans:
+                v = d["attrs"].get(key)
+                if (v == value or (isinstance(v, list) and value in v)) and d["traceId"] not in found:
+                    found.append(d["traceId"])
+            return found
+
+
+class FileExporter:
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, data: dict):
+        line = json.dumps(data, default=str) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    yield json.loads(line)
+        except FileNotFoundError:
+            return
+
+    def spans(self, trace_id: str) -> list:
+        return [d for d in self._read() if d["traceId"] == trace_id]
+
+    def find(self, key: str, value) -> list:
+        found = []
+        for d in self._read():
+            v = d["attrs"].get(key)
+            if (v == value or (isinstance(v, list) and value in v)) and d["traceId"] not in found:
+                found.append(d["traceId"])
+        return found
+
+
+def _load_exporter(name: str):
+    if name == "memory":
+        return MemoryExporter()
+    if name == "file":
+        return FileExporter()
+    module, _, attr = name.partition(":")
+    return getattr(importlib.import_module(module), attr)()
+
+
+exporters = [_load_exporter(n.strip()) for n in TRACE_EXPORTERS.split(",") if n.strip() and n.strip() != "none"]
+
+
+def add_exporter(exporter):
+    exporters.append(exporter)
+
+
+# Spans d’une trace connus des exportateurs relisibles du processus
+def spans(trace_id: str) -> list:
+    seen, out = set(), []
+    for exporter in exporters:
+        if hasattr(exporter, "spans"):
+            for d in exporter.spans(trace_id):
+                if d["spanId"] not in seen:
+                    seen.add(d["spanId"])
+                    out.append(d)
+    return sorted(out, key=lambda d: d["start"])
+
+
+def find(key: str, value) -> list:
+    found = []
+    for exporter in exporters:
+        if hasattr(exporter, "find"):
+            found += [t for t in exporter.find(key, value) if t not in found]
+    return found
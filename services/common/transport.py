@@ -0,0 +1,269 @@
+# ============================================================
+# transport.py — Transport des événements (module partagé)
+# ------------------------------------------------------------
+# Le publisher et le runtime de consommation ne parlent qu’à une
+# connexion obtenue par connect() :
+#   EVENT_TRANSPORT=rabbitmq (défaut) → pika.BlockingConnection
+#   EVENT_TRANSPORT=memory           → broker en mémoire du processus
+#
+# Le broker en mémoire reproduit le sous-ensemble de l’API de canal
+# pika utilisé par common/publisher.py et common/consumer.py, avec
+# la même sémantique :
+#   - échange topic (motifs "*" et "#"), une copie du message par
+#     file liée (diffusion)
+#   - files nommées partagées par plusieurs consommateurs
+#     (competing consumers), files exclusives supprimées à la
+#     fermeture de leur connexion, single-active-consumer
+#   - au moins une fois : un message non acquitté est remis en file
+#     (redelivered=True) sur nack(requeue) ou à la fermeture du canal
+#   - prefetch : au plus N messages non acquittés par canal
+# Aucun réseau ni sérialisation : le corps est l’objet publié (voir
+# l’encodage "object" de common/envelope.py).
+#
+# Usage : tests d’intégration, déploiement tout-en-un
+# (services/monolith.py).
+# ============================================================
+import os, re, time, itertools, threading
+from collections import deque
+
+EVENT_TRANSPORT = os.getenv("EVENT_TRANSPORT", "rabbitmq")
+
+
+class TransportError(Exception):
+    pass
+
+
+def connect(host: str, heartbeat: int = 60):
+    if EVENT_TRANSPORT == "memory":
+        return MemoryConnection(memory_broker)
+    import pika
+    return pika.BlockingConnection(pika.ConnectionParameters(host=host, heartbeat=heartbeat))
+
+
+# ------------------------------------------------------------
+# Broker en mémoire
+# ------------------------------------------------------------
+class _Result:
+    # forme de la réponse pika : res.method.queue / res.method.message_count
+    def __init__(self, **fields):
+        self.method = self
+        self.__dict__.update(fields)
+
+
+class _Method:
+    __slots__ = ("delivery_tag", "redelivered", "exchange", "routing_key")
+
+    def __init__(self, delivery_tag, redelivered, exchange, routing_key):
+        self.delivery_tag = delivery_tag
+        self.redelivered = redelivered
+        self.exchange = exchange
+        self.routing_key = routing_key
+
+
+class _Message:
+    __slots__ = ("exchange", "routing_key", "body", "properties", "redelivered")
+
+    def __init__(self, exchange, routing_key, body, properties, redelivered=False):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.redelivered = redelivered
+
+
+class _Queue:
+    def __init__(self, name: str, owner, arguments: dict):
+        self.name = name
+        self.owner = owner                      # connexion propriétaire (file exclusive)
+        self.single_active = bool((arguments or {}).get("x-single-active-consumer"))
+        self.messages = deque()
+        self.bindings = []                      # (exchange, motif compilé)
+        self.consumers = []                     # canaux abonnés, dans l’ordre
+
+
+def _topic(pattern: str):
+    # "*" = exactement un mot, "#" = zéro ou plusieurs mots
+    words = []
+    for w in pattern.split("."):
+        words.append(r"[^.]+" if w == "*" else r".*" if w == "#" else re.escape(w))
+    regex = r"\.".join(words).replace(r"\..*", r"(\..*)?").replace(r".*\.", r"(.*\.)?")
+    return re.compile(f"^{regex}$")
+
+
+class MemoryBroker:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.queues = {}
+        self._names = itertools.count(1)
+
+    def declare(self, conn, queue: str, exclusive: bool, arguments, passive: bool) -> _Queue:
+        with self.cond:
+            if passive:
+                if queue not in self.queues:
+                    raise TransportError(f"no queue '{queue}'")
+                return self.queues[queue]
+            if not queue:
+                queue = f"amq.gen-{next(self._names)}"
+            return self.queues.setdefault(queue, _Queue(queue, conn if exclusive else None, arguments))
+
+    def bind(self, exchange: str, queue: str, routing_key: str):
+        with self.cond:
+            q = self.queues[queue]
+            if not any(e == exchange and p.pattern == _topic(routing_key).pattern for e, p in q.bindings):
+                q.bindings.append((exchange, _topic(routing_key)))
+
+    def publish(self, exchange: str, routing_key: str, body, properties):
+        with self.cond:
+            for q in self.queues.values():
+                if any(e == exchange and p.match(routing_key) for e, p in q.bindings):
+                    q.messages.append(_Message(exchange, routing_key, body, properties))
+            self.cond.notify_all()
+
+    def requeue(self, queue: _Queue, messages):
+        with self.cond:
+            for m in reversed(messages):
+                m.redelivered = True
+                queue.messages.appendleft(m)
+            self.cond.notify_all()
+
+    def drop_connection(self, conn):
+        with self.cond:
+            for name in [n for n, q in self.queues.items() if q.owner is conn]:
+                del self.queues[name]
+            self.cond.notify_all()
+
+
+memory_broker = MemoryBroker()
+
+
+class MemoryChannel:
+    def __init__(self, conn):
+        self.conn = conn
+        self.broker = conn.broker
+        self.prefetch = 0
+        self.unacked = {}                       # delivery_tag → (file, message)
+        self._tags = itertools.count(1)
+        self.is_closed = False
+
+    # --- déclarations (exchange implicite, topic) -------------
+    def exchange_declare(self, exchange: str, exchange_type: str = "topic", durable: bool = True):
+        pass
+
+    def queue_declare(self, queue: str = "", durable: bool = False, exclusive: bool = False,
+                      arguments: dict = None, passive: bool = False):
+        q = self.broker.declare(self.conn, queue, exclusive, arguments, passive)
+        return _Result(queue=q.name, message_count=len(q.messages))
+
+    def queue_bind(self, exchange: str, queue: str, routing_key: str):
+        self.broker.bind(exchange, queue, routing_key)
+
+    def basic_qos(self, prefetch_count: int = 0):
+        self.prefetch = prefetch_count
+
+    # --- publication (synchrone : rien à confirmer) -----------
+    def confirm_delivery(self):
+        pass
+
+    def tx_select(self):
+        pass
+
+    def tx_commit(self):
+        pass
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None):
+        if self.is_closed:
+            raise TransportError("channel closed")
+        self.broker.publish(exchange, routing_key, body, properties)
+
+    # --- consommation ------------------------------------------
+    def _ready(self, q: _Queue) -> bool:
+        if not q.messages or (self.prefetch and len(self.unacked) >= self.prefetch):
+            return False
+        return not q.single_active or q.consumers[0] is self
+
+    def consume(self, queue: str, inactivity_timeout: float = None):
+        broker = self.broker
+        with broker.cond:
+            q = broker.queues[queue]
+            q.consumers.append(self)
+        try:
+            while not self.is_closed:
+                with broker.cond:
+                    deadline = None if inactivity_timeout is None else time.monotonic() + inactivity_timeout
+                    while not self.is_closed and not self._ready(q):
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            break
+                        broker.cond.wait(remaining)
+                    if self.is_closed:
+                        return
+                    if not self._ready(q):
+                        message = None
+                    else:
+                        message = q.messages.popleft()
+                        tag = next(self._tags)
+                        self.unacked[tag] = (q, message)
+                if message is None:
+                    yield None, None, None
+                else:
+                    yield (_Method(tag, message.redelivered, message.exchange, message.routing_key),
+                           message.properties, message.body)
+        finally:
+            with broker.cond:
+                if self in q.consumers:
+                    q.consumers.remove(self)
+                broker.cond.notify_all()
+
+    def _settle(self, delivery_tag: int, multiple: bool):
+        tags = [t for t in self.unacked if t <= delivery_tag] if multiple else [delivery_tag]
+        settled = [self.unacked.pop(t) for t in sorted(tags) if t in self.unacked]
+        with self.broker.cond:
+            self.broker.cond.notify_all()       # place libérée dans le prefetch
+        return settled
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False):
+        self._settle(delivery_tag, multiple)
+
+    def basic_nack(self, delivery_tag: int, multiple: bool = False, requeue: bool = True):
+        settled = self._settle(delivery_tag, multiple)
+        if requeue:
+            for q, m in settled:
+                self.broker.requeue(q, [m])
+
+    def close(self):
+        if self.is_closed:
+            return
+        self.is_closed = True
+        # non acquittés → remis en file (au moins une fois)
+        pending, self.unacked = list(self.unacked.values()), {}
+        for q, m in pending:
+            self.broker.requeue(q, [m])
+        with self.broker.cond:
+            self.broker.cond.notify_all()
+
+
+class MemoryConnection:
+    def __init__(self, broker: MemoryBroker):
+        self.broker = broker
+        self.channels = []
+        self.is_open = True
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def channel(self) -> MemoryChannel:
+        ch = MemoryChannel(self)
+        self.channels.append(ch)
+        return ch
+
+    def process_data_events(self, time_limit: float = 0):
+        pass
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        for ch in self.channels:
+            ch.close()
+        self.broker.drop_connection(self)
@@ -0,0 +1,91 @@
+# ============================================================
+# monolith.py — Les quatre services dans un seul processus
+# ------------------------------------------------------------
+# Monte Booking, Access, Quota et Notification dans UNE application
+# FastAPI, reliés par le broker en mémoire (common/transport.py) :
+# pas de RabbitMQ, pas de sérialisation des événements, mêmes files,
+# même diffusion et même redélivrance qu’avec RabbitMQ.
+#
+#   /              → Booking (API, UI, /debug/saga, /metrics)
+#   /access/...    → Access
+#   /quota/...     → Quota
+#   /notification/ → Notification
+#
+# Chaque service garde sa propre base (par défaut un fichier SQLite
+# par service dans MONOLITH_DATA, ou {SERVICE}_DATABASE_URL). Les
+# appels HTTP de Booking vers Access / Quota passent par MONOLITH_URL
+# (l’adresse de ce processus).
+#
+# Les services ont les mêmes noms de modules (app, models,
+# consumer...) : chacun est importé depuis son dossier puis ses
+# modules sont renommés "service.module" dans sys.modules avant
+# d’importer le suivant. Les modules common.* (broker, métriques,
+# traces) sont partagés : /metrics et /debug/traces de n’importe
+# quel service montrent tout le processus.
+#
+#   cd services && uvicorn monolith:app --port 8000
+# ============================================================
+import os, sys, importlib, tempfile
+from fastapi import FastAPI
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+os.environ.setdefault("EVENT_TRANSPORT", "memory")
+os.environ.setdefault("SERVICE_NAME", "monolith")
+
+MONOLITH_DATA = os.getenv("MONOLITH_DATA", os.path.join(tempfile.gettempdir(), "podcast-monolith"))
+MONOLITH_URL = os.getenv("MONOLITH_URL", "http://127.0.0.1:8000").rstrip("/")
+
+# service → préfixe de montage (Booking en dernier : il prend la racine)
+MOUNTS = {"access": "/access", "quota": "/quota", "notification": "/notification", "booking": ""}
+
+
+def database_url(service: str) -> str:
+    return os.getenv(f"{service.upper()}_DATABASE_URL") or f"sqlite:///{os.path.join(MONOLITH_DATA, service)}.db"
+
+
+def load_service(service: str):
+    # la configuration est lue à l’import des modules du service
+    os.environ["DATABASE_URL"] = database_url(service)
+    path = os.path.join(HERE, service)
+    sys.path.insert(0, path)
+    try:
+        module = importlib.import_module("app")
+    finally:
+        sys.path.remove(path)
+    for name, mod in list(sys.modules.items()):
+        if (getattr(mod, "__file__", None) or "").startswith(path + os.sep):
+            sys.modules[f"{service}.{name}"] = sys.modules.pop(name)
+    return module.app
+
+
+def create_app() -> FastAPI:
+    os.makedirs(MONOLITH_DATA, exist_ok=True)
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    for service, prefix in MOUNTS.items():
+        os.environ.setdefault(f"{service.upper()}_URL", MONOLITH_URL + prefix)
+    apps = {service: load_service(service) for service in MOUNTS}
+
+    monolith = FastAPI(title="Podcast Studio (monolith)")
+
+    # Starlette ne propage pas startup / shutdown aux applications montées
+    @monolith.on_event("startup")
+    async def startup():
+        for sub in apps.values():
+            await sub.router.startup()
+
+    @monolith.on_event("shutdown")
+    async def shutdown():
+        for sub in apps.values():
+            await sub.router.shutdown()
+
+    for service, prefix in MOUNTS.items():
+        monolith.mount(prefix, apps[service], name=service)
+    return monolith
+
+
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
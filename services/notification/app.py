@@ -1,13 +1,23 @@
 from fastapi import FastAPI
 import threading
-from consumer import start_consumer
+from consumer import start_consumer, dispatcher
+from common import metrics, tracing
 
 app = FastAPI(title="Notification Service")
+# span par requête + GET /debug/traces/{traceId} (common/tracing.py)
+tracing.instrument_app(app)
+# latence par route + GET /metrics (common/metrics.py)
+metrics.instrument_app(app)
 
 @app.on_event("startup")
 def startup():
     threading.Thread(target=start_consumer, daemon=True).start()
 
+# Envois en cours terminés avant l’arrêt (regroupements vidés)
+@app.on_event("shutdown")
+def shutdown():
+    dispatcher.stop()
+
 @app.get("/health")
 def health():
     return {"ok": True}
@@ -1,28 +1,44 @@
-import os, json, pika, time
-RABBIT = os.getenv("RABBITMQ_HOST", "rabbitmq")
+from common.consumer import BatchConsumer, PREFETCH
+from common.envelope import decode, peek_type
+from common import metrics, tracing
+from dispatcher import Dispatcher
+from senders import load_sender
+
+# BookingCreated n’est envoyé seul que si aucun autre événement de la
+# réservation ne suit dans NOTIFY_COALESCE_MS (voir dispatcher.py)
+NOTIFIED_EVENTS = ["BookingCreated", "BookingReady", "BookingCancelled", "BookingCheckedIn", "BookingCheckedOut"]
+
+# Instance du processus : l’envoi (sender NOTIFY_SENDER) se fait hors
+# du thread du consumer
+dispatcher = Dispatcher(load_sender())
 
 def on_message(ch, method, properties, body):
-    try:
-        msg = json.loads(body)
-    except Exception:
+    # type lu dans les propriétés AMQP : pas de décodage pour les autres
+    t = peek_type(properties)
+    if t is not None and t not in NOTIFIED_EVENTS:
         return
-    t = msg.get("type")
-    p = msg.get("payload", {})
-    if t in ("BookingReady", "BookingCancelled", "BookingCheckedIn", "BookingCheckedOut"):
-        print(f"[notification] {t} -> mock email: {p}", flush=True)
-
-def start_consumer():
-    while True:
+    with tracing.consumed(properties):
         try:
-            print("[notification] connecting to rabbitmq...", flush=True)
-            conn = pika.BlockingConnection(pika.ConnectionParameters(RABBIT, heartbeat=60))
-            ch = conn.channel()
-            ch.exchange_declare(exchange="events", exchange_type="fanout", durable=True)
-            q = ch.queue_declare(queue="", exclusive=True).method.queue
-            ch.queue_bind(exchange="events", queue=q)
-            print("[notification] bound to 'events'. waiting...", flush=True)
-            ch.basic_consume(queue=q, on_message_callback=on_message, auto_ack=True)
-            ch.start_consuming()
+            evt = decode(body, properties)
         except Exception as e:
-            print(f"[notification] error: {e} — retry 5s", flush=True)
-            time.sleep(5)
+            print(f"[notification] bad payload: {e}", flush=True)
+            return
+        tracing.tag(bookingId=evt.payload.get("bookingId"))
+        if evt.type in NOTIFIED_EVENTS:
+            dispatcher.submit(evt.type, evt.payload)
+
+def start_consumer():
+    dispatcher.start()
+    # handler historique (un message à la fois) : pas de DB, rien à regrouper.
+    # batch_size=1 : chaque message est acquitté (ou remis en file si le
+    # dispatcher est plein) avant le suivant, les heartbeats sont traités
+    # entre deux attentes de submit() ; prefetch borné par la capacité
+    # du dispatcher
+    BatchConsumer("notification", "notification.events", NOTIFIED_EVENTS, handler=on_message,
+                  batch_size=1, prefetch=min(PREFETCH, dispatcher.queue_max)).run()
+
+
+# Lancement autonome (répliques "worker" sans API, voir docker-compose.yml)
+if __name__ == "__main__":
+    metrics.start_http_server()
+    start_consumer()
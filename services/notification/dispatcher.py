@@ -0,0 +1,274 @@
+# ============================================================
+# dispatcher.py — Répartiteur asynchrone des notifications
+# ------------------------------------------------------------
+# Le consumer RabbitMQ (thread unique) ne fait plus l’envoi : il
+# remet chaque événement au dispatcher (submit) et passe au suivant.
+# Le dispatcher tourne dans sa propre boucle asyncio (thread dédié,
+# valable aussi pour les workers sans API) :
+#   - regroupement : un événement "d’ouverture" (NOTIFY_HOLD, par
+#     défaut BookingCreated) attend au plus NOTIFY_COALESCE_MS les
+#     suivants de la même réservation ; le premier événement suivant
+#     (BookingReady, BookingCancelled...) part aussitôt dans le MÊME
+#     message (Created → Ready = un seul e-mail). Les autres
+#     événements partent sans attendre. NOTIFY_COALESCE_MS=0 coupe
+#     le regroupement.
+#   - limite par destinataire : seau à jetons (NOTIFY_RATE_PER_MIN,
+#     rafale NOTIFY_BURST) ; un message en excès est retardé, pas
+#     perdu, et n’occupe pas de créneau d’envoi pendant l’attente
+#   - concurrence bornée : au plus NOTIFY_CONCURRENCY envois en
+#     parallèle (et autant de threads pour les senders bloquants)
+#   - délai par envoi (NOTIFY_SEND_TIMEOUT_S) et NOTIFY_RETRIES
+#     nouvelles tentatives avec backoff
+#   - contre-pression : au plus NOTIFY_QUEUE_MAX événements en cours
+#     (regroupés, retardés ou en envoi) ; au-delà submit() attend au
+#     plus NOTIFY_SUBMIT_TIMEOUT_S puis lève Requeue : le message est
+#     remis en file (nack) et le thread du consumer, qui entretient
+#     aussi les heartbeats de la connexion, n’est jamais bloqué
+#     longtemps par un sender lent
+#
+# Garantie : AU PLUS UNE FOIS. Un événement est acquitté côté broker
+# dès sa remise au dispatcher, avant l’envoi ; un arrêt brutal du
+# processus perd donc les e-mails en regroupement, retardés par la
+# limite ou en cours d’envoi, et un envoi en échec après
+# NOTIFY_RETRIES tentatives est abandonné. stop() vide ce qui est en
+# cours (arrêt propre du service).
+#
+# Métriques (common/metrics.py) : événements reçus / regroupés /
+# retardés, messages envoyés ou en échec, durée d’un envoi, délai
+# réception → envoi, envois en cours, événements en attente.
+# ============================================================
+import asyncio, os, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from common import metrics
+from common.consumer import Requeue
+
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "8"))
+NOTIFY_QUEUE_MAX = int(os.getenv("NOTIFY_QUEUE_MAX", "1000"))
+NOTIFY_SUBMIT_TIMEOUT_S = float(os.getenv("NOTIFY_SUBMIT_TIMEOUT_S", "1"))
+NOTIFY_COALESCE_MS = int(os.getenv("NOTIFY_COALESCE_MS", "3000"))
+NOTIFY_HOLD = [t for t in os.getenv("NOTIFY_HOLD", "BookingCreated").split(",") if t]
+NOTIFY_RATE_PER_MIN = float(os.getenv("NOTIFY_RATE_PER_MIN", "10"))
+NOTIFY_BURST = int(os.getenv("NOTIFY_BURST", "5"))
+NOTIFY_SEND_TIMEOUT_S = float(os.getenv("NOTIFY_SEND_TIMEOUT_S", "10"))
+NOTIFY_RETRIES = int(os.getenv("NOTIFY_RETRIES", "2"))
+# Seaux gardés en mémoire (les plus anciens sont oubliés au-delà)
+NOTIFY_RECIPIENTS_MAX = int(os.getenv("NOTIFY_RECIPIENTS_MAX", "10000"))
+
+SUBJECTS = {
+    "BookingCreated":    "Réservation #{bookingId} enregistrée",
+    "BookingReady":      "Réservation #{bookingId} confirmée",
+    "BookingCancelled":  "Réservation #{bookingId} annulée",
+    "BookingCheckedIn":  "Check-in effectué (réservation #{bookingId})",
+    "BookingCheckedOut": "Check-out effectué (réservation #{bookingId})",
+}
+
+
+def recipient_of(payload: dict) -> str:
+    # userId ajouté aux événements de cycle de vie ; les anciens
+    # messages sans userId retombent sur la réservation
+    if payload.get("userId") is not None:
+        return f"user-{payload['userId']}"
+    return f"booking-{payload.get('bookingId')}"
+
+
+# Un message = un ou plusieurs événements d’une même réservation
+class Message:
+    def __init__(self, event_type: str, payload: dict):
+        self.recipient = recipient_of(payload)
+        self.booking_id = payload.get("bookingId")
+        self.types = [event_type]
+        self.payload = dict(payload)
+        self.received = time.monotonic()
+        self.flush = None  # TimerHandle du regroupement
+
+    def add(self, event_type: str, payload: dict):
+        self.types.append(event_type)
+        self.payload.update(payload)
+
+    def subject(self) -> str:
+        return SUBJECTS.get(self.types[-1], "{type}").format_map({**self.payload, "type": self.types[-1]})
+
+    def body(self) -> str:
+        lines = [self.subject(), ""]
+        lines += [f"- {t}" for t in self.types]
+        lines += ["", *(f"{k}: {v}" for k, v in sorted(self.payload.items()))]
+        return "\n".join(lines)
+
+
+# Seau à jetons d’un destinataire
+class Bucket:
+    def __init__(self, rate_per_s: float, burst: int):
+        self.rate = rate_per_s
+        self.burst = burst
+        self.tokens = float(burst)
+        self.at = time.monotonic()
+
+    # Réserve un jeton ; renvoie l’attente (s) avant de pouvoir envoyer
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.at) * self.rate)
+        self.at = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class Dispatcher:
+    def __init__(self, sender, concurrency: int = NOTIFY_CONCURRENCY, queue_max: int = NOTIFY_QUEUE_MAX,
+                 coalesce_ms: int = NOTIFY_COALESCE_MS, hold=NOTIFY_HOLD,
+                 rate_per_min: float = NOTIFY_RATE_PER_MIN, burst: int = NOTIFY_BURST,
+                 send_timeout: float = NOTIFY_SEND_TIMEOUT_S, retries: int = NOTIFY_RETRIES):
+        self.sender = sender
+        self.concurrency = max(1, concurrency)
+        self.coalesce_s = coalesce_ms / 1000
+        self.hold = set(hold)
+        self.rate_per_s = rate_per_min / 60
+        self.burst = max(1, burst)
+        self.send_timeout = send_timeout
+        self.retries = retries
+
+        self.queue_max = max(1, queue_max)
+        self.slots = threading.BoundedSemaphore(self.queue_max)
+        self.pending = {}             # booking_id → Message en cours de regroupement
+        self.buckets = OrderedDict()  # destinataire → Bucket (LRU)
+        self.outstanding = 0          # événements remis et pas encore traités
+        self.in_flight = 0
+        self.loop = None
+        self.idle = None
+
+        self.events = metrics.counter("notify_events_total", "Événements remis au dispatcher")
+        self.coalesced = metrics.counter("notify_coalesced_total", "Événements joints à un message déjà ouvert")
+        self.rejected = metrics.counter("notify_requeued_total", "Événements remis en file (dispatcher plein)")
+        self.limited = metrics.counter("notify_rate_limited_total", "Messages retardés par la limite du destinataire")
+        self.sent = metrics.counter("notify_messages_total", "Messages envoyés", outcome="sent")
+        self.failed = metrics.counter("notify_messages_total", "Messages envoyés", outcome="failed")
+        self.send_latency = metrics.histogram("notify_send_seconds", "Durée d’un appel au sender")
+        self.delivery_latency = metrics.histogram("notify_delivery_seconds", "Réception de l’événement → envoi",
+                                                  buckets=metrics.LAG_BUCKETS)
+        metrics.gauge("notify_in_flight", "Envois en cours", fn=lambda: self.in_flight)
+        metrics.gauge("notify_outstanding", "Événements en attente (regroupement, limite, envoi)",
+                      fn=lambda: self.outstanding)
+
+    # --------------------------------------------------------
+    # Boucle asyncio dédiée
+    # --------------------------------------------------------
+    def start(self):
+        if self.loop is not None:
+            return self
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(ready,), name="notify-dispatcher", daemon=True).start()
+        ready.wait()
+        return self
+
+    def _run(self, ready: threading.Event):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # threads des senders bloquants (smtplib...) : un par créneau
+        self.loop.set_default_executor(ThreadPoolExecutor(self.concurrency, thread_name_prefix="notify-send"))
+        self.send_slots = asyncio.Semaphore(self.concurrency)
+        self.idle = asyncio.Event()
+        self.idle.set()
+        ready.set()
+        self.loop.run_forever()
+
+    # Appelé par le consumer (autre thread) ; attend au plus `timeout`
+    # secondes une place si NOTIFY_QUEUE_MAX événements sont en cours,
+    # puis lève Requeue (message remis en file par le consumer)
+    def submit(self, event_type: str, payload: dict, timeout: float = NOTIFY_SUBMIT_TIMEOUT_S):
+        if not self.slots.acquire(timeout=timeout):
+            self.rejected.inc()
+            raise Requeue(f"{self.queue_max} notifications pending")
+        self.events.inc()
+        self.loop.call_soon_threadsafe(self._accept, event_type, payload)
+
+    # Vide les regroupements puis attend la fin des envois en cours
+    def stop(self, timeout: float = 10):
+        if self.loop is None:
+            return
+        async def drain():
+            for msg in list(self.pending.values()):
+                self._release(msg)
+            await self.idle.wait()
+        try:
+            asyncio.run_coroutine_threadsafe(asyncio.wait_for(drain(), timeout), self.loop).result()
+        except Exception as e:
+            print(f"[notification] dispatcher stopped with {self.outstanding} event(s) pending: {e!r}", flush=True)
+
+    # --------------------------------------------------------
+    # Regroupement
+    # --------------------------------------------------------
+    def _accept(self, event_type: str, payload: dict):
+        self.outstanding += 1
+        self.idle.clear()
+        msg = self.pending.get(payload.get("bookingId"))
+        if msg is not None:
+            # suite d’une rafale : le message part avec cet événement
+            msg.add(event_type, payload)
+            self.coalesced.inc()
+            if event_type not in self.hold:
+                self._release(msg)
+            return
+        msg = Message(event_type, payload)
+        if self.coalesce_s > 0 and event_type in self.hold and msg.booking_id is not None:
+            self.pending[msg.booking_id] = msg
+            msg.flush = self.loop.call_later(self.coalesce_s, self._release, msg)
+            return
+        self.loop.create_task(self._deliver(msg))
+
+    def _release(self, msg: Message):
+        if self.pending.get(msg.booking_id) is not msg:
+            return
+        del self.pending[msg.booking_id]
+        msg.flush.cancel()
+        self.loop.create_task(self._deliver(msg))
+
+    # --------------------------------------------------------
+    # Limite par destinataire + envoi borné
+    # --------------------------------------------------------
+    def _bucket(self, recipient: str) -> Bucket:
+        bucket = self.buckets.get(recipient)
+        if bucket is None:
+            bucket = self.buckets[recipient] = Bucket(self.rate_per_s, self.burst)
+            if len(self.buckets) > NOTIFY_RECIPIENTS_MAX:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(recipient)
+        return bucket
+
+    async def _deliver(self, msg: Message):
+        try:
+            wait = self._bucket(msg.recipient).take() if self.rate_per_s > 0 else 0.0
+            if wait > 0:
+                self.limited.inc()
+                await asyncio.sleep(wait)
+            ok = await self._send(msg)
+            (self.sent if ok else self.failed).inc()
+            if ok:
+                self.delivery_latency.observe(time.monotonic() - msg.received)
+        finally:
+            n = len(msg.types)
+            self.outstanding -= n
+            for _ in range(n):
+                self.slots.release()
+            if not self.outstanding:
+                self.idle.set()
+
+    # Le créneau d’envoi est rendu pendant le backoff
+    async def _send(self, msg: Message) -> bool:
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.send_slots:
+                    self.in_flight += 1
+                    try:
+                        with self.send_latency.time():
+                            await asyncio.wait_for(self.sender.send(msg), self.send_timeout)
+                    finally:
+                        self.in_flight -= 1
+                return True
+            except Exception as e:
+                retry = attempt < self.retries
+                print(f"[notification] send to {msg.recipient} failed: {e!r}"
+                      f"{' — retrying' if retry else ' — dropped'}", flush=True)
+                if retry:
+                    await asyncio.sleep(min(2 ** attempt, 30))
+        return False
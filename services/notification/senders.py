@@ -0,0 +1,62 @@
+# ============================================================
+# senders.py — Envoi effectif des notifications (interchangeable)
+# ------------------------------------------------------------
+# Un sender expose `async def send(message)` ; le dispatcher
+# (dispatcher.py) l’appelle au plus NOTIFY_CONCURRENCY fois en
+# parallèle et mesure chaque appel. Choix par NOTIFY_SENDER :
+#   - "log"  (défaut) : l’ancien "mock email", une ligne de log
+#   - "smtp" : vrai message SMTP vers SMTP_HOST:SMTP_PORT (par
+#     exemple le serveur de test smtp_sink.py) ; smtplib étant
+#     bloquant, l’envoi passe par un thread du pool du dispatcher
+#   - "module:Classe" : tout autre sender importable (SMS, API...)
+# ============================================================
+import asyncio, importlib, os, smtplib
+from email.message import EmailMessage
+
+NOTIFY_SENDER = os.getenv("NOTIFY_SENDER", "log")
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+SMTP_FROM = os.getenv("SMTP_FROM", "studio@podcast.local")
+SMTP_TIMEOUT_S = float(os.getenv("SMTP_TIMEOUT_S", "10"))
+# Adresse d’un destinataire ("user-42", "booking-7"...)
+NOTIFY_ADDRESS = os.getenv("NOTIFY_ADDRESS", "{recipient}@podcast.local")
+
+
+class LogSender:
+    async def send(self, message):
+        print(f"[notification] {'+'.join(message.types)} -> mock email to {message.recipient}: "
+              f"{message.subject()} {message.payload}", flush=True)
+
+
+class SmtpSender:
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, sender: str = SMTP_FROM,
+                 timeout: float = SMTP_TIMEOUT_S):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.timeout = timeout
+
+    async def send(self, message):
+        await asyncio.get_running_loop().run_in_executor(None, self._send, message)
+
+    def _send(self, message):
+        mail = EmailMessage()
+        mail["From"] = self.sender
+        mail["To"] = NOTIFY_ADDRESS.format(recipient=message.recipient)
+        mail["Subject"] = message.subject()
+        mail.set_content(message.body())
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(mail)
+
+
+SENDERS = {"log": LogSender, "smtp": SmtpSender}
+
+
+def load_sender(name: str = NOTIFY_SENDER):
+    if name in SENDERS:
+        return SENDERS[name]()
+    module, sep, attr = name.partition(":")
+    if not sep:
+        raise ValueError(f"unknown sender {name!r} (expected {', '.join(SENDERS)} or module:Class)")
+    return getattr(importlib.import_module(module), attr)()
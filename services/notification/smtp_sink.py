@@ -0,0 +1,116 @@
+# ============================================================
+# smtp_sink.py — Serveur SMTP local de test (aucune remise réelle)
+# ------------------------------------------------------------
+# Accepte tout message (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP,
+# QUIT), le compte et en garde les derniers en mémoire. --delay-ms
+# simule un fournisseur lent (attente avant le "250" de DATA) pour
+# mesurer l’effet de NOTIFY_CONCURRENCY sur le débit.
+#
+#   python smtp_sink.py --port 1025 --delay-ms 200
+#   NOTIFY_SENDER=smtp SMTP_HOST=localhost SMTP_PORT=1025 uvicorn app:app
+#
+# Utilisé aussi dans un processus (bench/notify.py) : SmtpSink.start()
+# dans la boucle asyncio courante.
+# ============================================================
+import argparse, asyncio
+from collections import deque, namedtuple
+
+Mail = namedtuple("Mail", ["sender", "recipients", "data"])
+
+
+class SmtpSink:
+    def __init__(self, host: str = "127.0.0.1", port: int = 1025, delay_ms: int = 0,
+                 keep: int = 100, quiet: bool = True):
+        self.host = host
+        self.port = port
+        self.delay = delay_ms / 1000
+        self.quiet = quiet
+        self.received = 0
+        self.mails = deque(maxlen=keep)
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._session, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # port 0 → port choisi
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _session(self, reader, writer):
+        def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+
+        sender, recipients = None, []
+        reply("220 smtp-sink ready")
+        try:
+            while True:
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    return
+                verb = line[:4].decode("ascii", "replace").upper()
+                if verb == "EHLO":
+                    reply("250-smtp-sink\r\n250-8BITMIME\r\n250 SMTPUTF8")
+                elif verb == "HELO":
+                    reply("250 smtp-sink")
+                elif verb == "MAIL":
+                    sender, recipients = line[10:].strip().decode(errors="replace"), []
+                    reply("250 OK")
+                elif verb == "RCPT":
+                    recipients.append(line[8:].strip().decode(errors="replace"))
+                    reply("250 OK")
+                elif verb == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    data = await self._data(reader)
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    self.received += 1
+                    self.mails.append(Mail(sender, recipients, data))
+                    if not self.quiet:
+                        print(f"[smtp-sink] #{self.received} {sender} -> {', '.join(recipients)} "
+                              f"({len(data)} bytes)", flush=True)
+                    reply(f"250 OK queued as {self.received}")
+                    sender, recipients = None, []
+                elif verb in ("RSET", "NOOP"):
+                    if verb == "RSET":
+                        sender, recipients = None, []
+                    reply("250 OK")
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    return
+                else:
+                    reply("502 Command not implemented")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        finally:
+            writer.close()
+
+    # Corps jusqu’à la ligne "." seule ; ".." en début de ligne → "."
+    async def _data(self, reader) -> bytes:
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise asyncio.IncompleteReadError(b"", None)
+            if line in (b".\r\n", b".\n"):
+                return b"".join(lines)
+            lines.append(line[1:] if line.startswith(b"..") else line)
+
+
+async def main(args):
+    sink = await SmtpSink(args.host, args.port, args.delay_ms, quiet=args.quiet).start()
+    print(f"[smtp-sink] listening on {args.host}:{sink.port} (delay {args.delay_ms} ms)", flush=True)
+    await sink.server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur SMTP local de test")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--delay-ms", type=int, default=0, help="latence simulée par message")
+    parser.add_argument("--quiet", action="store_true", help="pas de ligne par message")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,51 @@
+# Balayeur du service Quota (voir common/sweeper.py)
+#   released : HELD dont le créneau est terminé depuis plus de
+#              QUOTA_HOLD_GRACE_H heures sans check-out (réservation
+#              annulée ou jamais utilisée) → RELEASED, minutes rendues
+#              à QuotaUsage ; lignes sans ends_at : fin de semaine
+#   archived : RELEASED / DENIED / COMMITTED des semaines de plus de
+#              QUOTA_ARCHIVE_AFTER_DAYS jours → quotareservationarchive
+#              (les COMMITTED archivés restent comptés par
+#              usage.rebuild)
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, or_
+from sqlmodel import Session, select
+from models import QuotaReservation, QuotaReservationArchive
+import usage
+from common.sweeper import Sweeper, archive_rows, in_batches
+
+HOLD_GRACE_H = float(os.getenv("QUOTA_HOLD_GRACE_H", "24"))
+ARCHIVE_AFTER_DAYS = float(os.getenv("QUOTA_ARCHIVE_AFTER_DAYS", "35"))
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def release_stale_batch(engine, batch_size: int) -> int:
+    cutoff = _utcnow() - timedelta(hours=HOLD_GRACE_H)
+    stale = or_(and_(QuotaReservation.ends_at.is_not(None), QuotaReservation.ends_at < cutoff),
+                and_(QuotaReservation.ends_at.is_(None), QuotaReservation.week_start < cutoff - timedelta(days=7)))
+    with Session(engine) as s:
+        ids = s.exec(select(QuotaReservation.id).where(QuotaReservation.status == "HELD", stale)
+                     .order_by(QuotaReservation.id).limit(batch_size)).all()
+        # usage.release : transition conditionnelle + agrégat, même transaction
+        for rid in ids:
+            usage.release(s, rid)
+        s.commit()
+    return len(ids)
+
+
+def archive_batch(engine, batch_size: int) -> int:
+    cutoff = _utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    return archive_rows(engine, QuotaReservation, QuotaReservationArchive, QuotaReservation.id,
+                        QuotaReservation.status.in_(("RELEASED", "DENIED", "COMMITTED"))
+                        & (QuotaReservation.week_start < cutoff), batch_size)
+
+
+def make_sweeper(engine) -> Sweeper:
+    return Sweeper("quota", {
+        "released": lambda: in_batches(lambda n: release_stale_batch(engine, n)),
+        "archived": lambda: in_batches(lambda n: archive_batch(engine, n)),
+    })
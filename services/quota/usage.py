@@ -0,0 +1,133 @@
+# Compteur hebdomadaire matérialisé (QuotaUsage)
+#
+# Chaque transition d’une QuotaReservation met à jour l’agrégat dans la
+# même transaction :
+#   reserve : minutes_held      += m   (UPDATE conditionnel ≤ MAX_MIN)
+#   commit  : minutes_held      -= m ; minutes_committed += m
+#   release : minutes_held (ou minutes_committed) -= m
+#
+# Rebuild / backfill depuis QuotaReservation ET les COMMITTED déjà
+# archivés par le balayeur (QuotaReservationArchive, semaines de plus
+# de QUOTA_ARCHIVE_AFTER_DAYS jours) : les minutes consommées des
+# semaines anciennes sont conservées.
+#   python usage.py rebuild
+import sys
+from datetime import datetime
+from sqlalchemy import case, delete, func, insert, text, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from models import QuotaReservation, QuotaReservationArchive, QuotaUsage
+
+ACTIVE = ("HELD", "COMMITTED")
+
+
+def _run(s: Session, stmt) -> int:
+    # les UPDATE portent sur des colonnes jamais chargées en session :
+    # inutile de synchroniser l’identity map
+    return s.exec(stmt.execution_options(synchronize_session=False)).rowcount
+
+
+def _ensure_row(s: Session, user_id: int, wk: datetime):
+    values = dict(user_id=user_id, week_start=wk, minutes_held=0, minutes_committed=0)
+    dialect = s.get_bind().dialect.name
+    if dialect == "postgresql":
+        s.exec(postgresql.insert(QuotaUsage).values(**values).on_conflict_do_nothing())
+    elif dialect == "sqlite":
+        s.exec(sqlite.insert(QuotaUsage).values(**values).on_conflict_do_nothing())
+    else:
+        try:
+            with s.begin_nested():
+                s.exec(insert(QuotaUsage).values(**values))
+        except IntegrityError:
+            pass
+
+
+def _add(s: Session, user_id: int, wk: datetime, held: int = 0, committed: int = 0) -> int:
+    return _run(s, update(QuotaUsage)
+                .where(QuotaUsage.user_id == user_id, QuotaUsage.week_start == wk)
+                .values(minutes_held=QuotaUsage.minutes_held + held,
+                        minutes_committed=QuotaUsage.minutes_committed + committed))
+
+
+# Admission atomique : UPDATE ... WHERE held + committed + :d <= :max
+# Le verrou de ligne posé par l’UPDATE sérialise les admissions
+# concurrentes d’un même utilisateur jusqu’au commit.
+def try_reserve(s: Session, user_id: int, wk: datetime, minutes: int, max_min: int) -> bool:
+    stmt = (update(QuotaUsage)
+            .where(QuotaUsage.user_id == user_id, QuotaUsage.week_start == wk,
+                   QuotaUsage.minutes_held + QuotaUsage.minutes_committed + minutes <= max_min)
+            .values(minutes_held=QuotaUsage.minutes_held + minutes))
+    if _run(s, stmt) == 1:
+        return True
+    # première réservation de la semaine : on crée la ligne puis on réessaie
+    _ensure_row(s, user_id, wk)
+    return _run(s, stmt) == 1
+
+
+# HELD → COMMITTED ; renvoie False si la réservation n’existe pas
+def commit(s: Session, reservation_id: int) -> bool:
+    qr = s.get(QuotaReservation, reservation_id)
+    if not qr:
+        return False
+    moved = _run(s, update(QuotaReservation)
+                 .where(QuotaReservation.id == reservation_id, QuotaReservation.status == "HELD")
+                 .values(status="COMMITTED"))
+    if moved:
+        _add(s, qr.user_id, qr.week_start, held=-qr.minutes_reserved, committed=qr.minutes_reserved)
+    return True
+
+
+# HELD | COMMITTED → RELEASED ; renvoie False si la réservation n’existe pas
+def release(s: Session, reservation_id: int) -> bool:
+    qr = s.get(QuotaReservation, reservation_id)
+    if not qr:
+        return False
+    for prev in ACTIVE:
+        moved = _run(s, update(QuotaReservation)
+                     .where(QuotaReservation.id == reservation_id, QuotaReservation.status == prev)
+                     .values(status="RELEASED"))
+        if moved:
+            if prev == "HELD":
+                _add(s, qr.user_id, qr.week_start, held=-qr.minutes_reserved)
+            else:
+                _add(s, qr.user_id, qr.week_start, committed=-qr.minutes_reserved)
+            break
+    return True
+
+
+# Recalcule tout l’agrégat depuis QuotaReservation + les COMMITTED
+# archivés (un seul INSERT ... SELECT ; une ligne HELD n’est jamais
+# archivée). only_if_empty=True : backfill au démarrage après l’ajout
+# de la table.
+def rebuild(s: Session, only_if_empty: bool = False) -> int:
+    if s.get_bind().dialect.name == "postgresql":
+        # bloque les admissions concurrentes pendant le recalcul
+        s.exec(text(f"LOCK TABLE {QuotaUsage.__tablename__} IN EXCLUSIVE MODE"))
+    if only_if_empty and s.exec(select(func.count()).select_from(QuotaUsage)).one() > 0:
+        return 0
+    s.exec(delete(QuotaUsage))
+    rows = union_all(
+        select(QuotaReservation.user_id, QuotaReservation.week_start, QuotaReservation.status,
+               QuotaReservation.minutes_reserved).where(QuotaReservation.status.in_(ACTIVE)),
+        select(QuotaReservationArchive.user_id, QuotaReservationArchive.week_start, QuotaReservationArchive.status,
+               QuotaReservationArchive.minutes_reserved).where(QuotaReservationArchive.status == "COMMITTED"),
+    ).subquery()
+    held = func.sum(case((rows.c.status == "HELD", rows.c.minutes_reserved), else_=0))
+    committed = func.sum(case((rows.c.status == "COMMITTED", rows.c.minutes_reserved), else_=0))
+    agg = select(rows.c.user_id, rows.c.week_start, held, committed).group_by(rows.c.user_id, rows.c.week_start)
+    res = s.exec(insert(QuotaUsage).from_select(
+        ["user_id", "week_start", "minutes_held", "minutes_committed"], agg))
+    return res.rowcount
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python usage.py rebuild", file=sys.stderr)
+        sys.exit(2)
+    from models import engine, create_tables
+    create_tables(engine)
+    with Session(engine) as s:
+        n = rebuild(s)
+        s.commit()
+    print(f"[quota-usage] rebuilt {n} user-week rows", flush=True)
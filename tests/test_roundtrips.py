@@ -0,0 +1,80 @@
+# ============================================================
+# test_roundtrips.py — Allers-retours DB par opération
+# ------------------------------------------------------------
+# Joue quelques réservations complètes dans le monolithe en processus
+# (services/monolith.py : SQLite + broker en mémoire, voir
+# bench/roundtrips.py) et vérifie sur /metrics le nombre de requêtes
+# SQL + commits par route et par message consommé. Ces valeurs ne
+# dépendent pas de la machine : une régression (lecture en trop,
+# second commit...) fait échouer le test.
+#
+#   pip install pytest uvicorn httpx && python -m pytest tests
+# ============================================================
+import asyncio, os, random, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+
+import pytest
+from load import InProcessTarget, parse_metrics
+from roundtrips import saga, per_operation
+
+SAGAS = 8
+
+
+async def run():
+    studio_base = random.randint(1, 10**6) * 1000
+    async with InProcessTarget() as target:
+        booking = target.client("booking")
+        outcomes = [await saga(target, i, studio_base) for i in range(SAGAS)]
+        before = per_operation(parse_metrics((await booking.get("/metrics")).text))
+        # rejets : réservation inconnue, puis réservation déjà terminée
+        unknown = await booking.post("/v1/bookings/999999999/checkin", params={"code": "000000"})
+        finished = (await booking.get("/v1/bookings", params={"status": "FINISHED", "limit": 1})).json()
+        done = await booking.post(f"/v1/bookings/{finished['items'][0]['id']}/checkin", params={"code": "000000"})
+        await asyncio.sleep(1)   # derniers messages (notification, status-watch)
+        after = per_operation(parse_metrics((await booking.get("/metrics")).text))
+    return outcomes, before, after, unknown.status_code, done.status_code
+
+
+@pytest.fixture(scope="module")
+def measured():
+    return asyncio.run(run())
+
+
+def mean(ops: dict, kind: str, name: str) -> float:
+    assert name in ops[kind], f"{name} not measured: {sorted(ops[kind])}"
+    return ops[kind][name]["mean"]
+
+
+def test_sagas_complete(measured):
+    outcomes, *_ = measured
+    assert "FINISHED" in outcomes
+    assert set(outcomes) <= {"FINISHED", "CANCELLED"}
+
+
+def test_route_round_trips(measured):
+    _, ops, *_ = measured
+    # INSERT réservation + chevauchement + journal + outbox, un commit
+    assert mean(ops, "routes", "POST /v1/bookings") <= 6
+    # UPDATE ... WHERE status = :attendu RETURNING, journal, outbox, commit
+    assert mean(ops, "routes", "POST /v1/bookings/{booking_id}/checkin") <= 4
+    assert mean(ops, "routes", "POST /v1/bookings/{booking_id}/checkout") <= 4
+    # vue servie par le cache après la première lecture
+    assert mean(ops, "routes", "GET /v1/bookings/{booking_id}") <= 1.5
+
+
+def test_consumer_round_trips(measured):
+    _, ops, *_ = measured
+    # marqueur de dédoublonnage + mise à jour conditionnelle + journal
+    # + outbox, un commit par lot
+    assert mean(ops, "consumers", "consumer") <= 5
+    assert mean(ops, "consumers", "access-consumer") <= 4
+    quota = [r["mean"] for name, r in ops["consumers"].items() if name.startswith("quota-consumer-")]
+    assert quota and max(quota) <= 7
+
+
+def test_checkin_rejected_before_access(measured):
+    _, before, after, unknown, done = measured
+    assert (unknown, done) == (404, 409)
+    validate = "POST /v1/access/validate"
+    assert after["routes"].get(validate, {}).get("count") == before["routes"].get(validate, {}).get("count")